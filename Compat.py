@@ -0,0 +1,37 @@
+"""
+Micropython module with the time functions of utime, also for the host.
+
+On the Pico the functions of utime are used unchanged. On the host (replay.py,
+the demos and the analyses) they have the same semantics: ticks_ms and ticks_us
+wrap at TICKS_PERIOD like on the RP2040, ticks_diff and ticks_add work modulo
+TICKS_PERIOD and the sleeps return at once for negative times.
+"""
+TICKS_PERIOD = 1 << 30
+
+try:
+    from utime import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms, sleep_us
+except ImportError: # host
+    from time import perf_counter_ns, sleep
+
+    TICKS_MAX = TICKS_PERIOD - 1
+    TICKS_HALF = TICKS_PERIOD >> 1
+
+    def ticks_ms():
+        return (perf_counter_ns() // 1_000_000) & TICKS_MAX
+
+    def ticks_us():
+        return (perf_counter_ns() // 1000) & TICKS_MAX
+
+    def ticks_diff(a, b):
+        return ((a - b + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+    def ticks_add(a, b):
+        return (a + b) & TICKS_MAX
+
+    def sleep_ms(ms):
+        if ms > 0:
+            sleep(ms / 1e3)
+
+    def sleep_us(us):
+        if us > 0:
+            sleep(us / 1e6)
@@ -0,0 +1,127 @@
+"""
+Micropython module with viper compiled hot loops for feeding the step generator.
+
+The loops read the microsecond timer and the GPIO input register directly and
+write the TX FIFO of the state machine without any attribute lookups. They wait
+for absolute deadlines, so the time of the stop check does not add to the
+period. On CPython (host tests) VIPER is False and the callers keep their
+portable loops; the decorators native and viper are no-ops there.
+"""
+try:
+    import micropython
+    from micropython import const
+    native = micropython.native
+    viper = micropython.viper
+    VIPER = True
+except (ImportError, AttributeError): # host or firmware without native emitter
+    def const(value):
+        return value
+    def native(function):
+        return function
+    viper = native
+    VIPER = False
+
+# RP2040 registers
+TIMERAWL = const(0x40054028)  # lower 32 bits of the 1 MHz timer
+GPIO_IN = const(0xd0000004)   # SIO, input value of GPIO 0..29
+PIO0_BASE = const(0x50200000)
+PIO1_BASE = const(0x50300000)
+PIO_FSTAT = const(0x004)      # bits 19..16: TX FIFO of SM 3..0 full
+PIO_TXF0 = const(0x010)
+PIO_RXF0 = const(0x020)
+
+
+def txf_address(smID):
+    """Returns the address of the TX FIFO of the state machine smID (0..7)."""
+    return (PIO0_BASE if smID < 4 else PIO1_BASE) + PIO_TXF0 + 4 * (smID % 4)
+
+def rxf_address(smID):
+    """Returns the address of the RX FIFO of the state machine smID (0..7)."""
+    return (PIO0_BASE if smID < 4 else PIO1_BASE) + PIO_RXF0 + 4 * (smID % 4)
+
+
+@viper
+def read_gpio() -> int:
+    """Returns the input levels of all GPIOs, bit n = GPIO n."""
+    return int(ptr32(GPIO_IN)[0])
+
+@viper
+def wait_steps(steps: int, period: int, stop_mask: int) -> int:
+    """
+    Waits steps periods of a running step generator, checking the stop pin (stop_mask = 1 << pin)
+    before every period except the first, like Stepper.execute_steps.
+
+    Returns:
+    The number of performed steps
+    """
+    timer = ptr32(TIMERAWL)
+    gpio = ptr32(GPIO_IN)
+    deadline = int(timer[0]) + period
+    i = 1
+    while True:
+        while int(timer[0]) - deadline < 0:
+            pass
+        if i >= steps:
+            return steps
+        if (int(gpio[0]) & int(gpio[0]) & int(gpio[0]) & stop_mask) == 0:
+            return i
+        deadline += period
+        i += 1
+
+@viper
+def feed_ramp(txf: int, period_times, n: int, stop_mask: int) -> int:
+    """
+    Writes the period times (array('I')) 1..n-1 into the TX FIFO at address txf, each one after
+    the period before has elapsed, like Stepper.execute_ramp. The caller has already put the
+    first period and activated the state machine.
+
+    Returns:
+    The number of performed steps
+    """
+    timer = ptr32(TIMERAWL)
+    gpio = ptr32(GPIO_IN)
+    periods = ptr32(period_times)
+    fifo = ptr32(txf)
+    fstat = ptr32((txf & 0xfffff000) + PIO_FSTAT)
+    full = 1 << (16 + ((txf - PIO_TXF0) & 0xf) // 4)
+    deadline = int(timer[0]) + int(periods[0])
+    index = 1
+    while index < n:
+        while int(timer[0]) - deadline < 0:
+            pass
+        period = int(periods[index])
+        while int(fstat[0]) & full:
+            pass
+        fifo[0] = period
+        if (int(gpio[0]) & int(gpio[0]) & int(gpio[0]) & stop_mask) == 0:
+            return index
+        deadline += period
+        index += 1
+    while int(timer[0]) - deadline < 0:
+        pass
+    return n
+
+
+if __name__ == "__main__":
+    # per iteration cost of the portable loop of PIOStreamBackend.execute_steps and of wait_steps (period 0)
+    from machine import Pin
+    from utime import ticks_us, ticks_diff, sleep_us
+    stop = Pin(18, Pin.IN, Pin.PULL_UP)
+    n = 10000
+
+    def portable(steps, period_time):
+        for i in range(steps - 1):
+            before_if = ticks_us()
+            if stop.value() == 0 or stop.value() == 0 or stop.value() == 0:
+                return i + 1
+            after_if = ticks_us()
+            sleep_us(period_time + before_if - after_if)
+        return steps
+
+    t = ticks_us()
+    portable(n, 0)
+    print("portable: %.2f us per step" % (ticks_diff(ticks_us(), t) / n))
+    if VIPER:
+        t = ticks_us()
+        wait_steps(n, 0, 1 << 18)
+        print("viper:    %.2f us per step" % (ticks_diff(ticks_us(), t) / n))
@@ -0,0 +1,127 @@
+"""
+Micropython module with integer arithmetic for the step period computation.
+
+Micropython stores integers up to 30 bits without allocating memory and the
+RP2040 has no FPU, so all values are scaled integers kept below 2**30:
+
+    frequencies: Q10, 1/1024 Hz                  (FREQ_SHIFT)
+    periods:     Q4, 1/16 us inside the ramps     (PERIOD_SHIFT)
+    factors:     Q10, 1024 = 1.0                  (FACTOR_SHIFT)
+    corrections: Q20, 2**20 = 1.0 for calc_ramp   (CORRECTION_SHIFT)
+
+Error bounds versus the float version of calc_ramp (asserted by running this
+module on the host): the number of ramp steps differs by at most 1, the periods
+by at most 1 us. The acceleration of a ramp is set up with the Q20 correction
+factor: rounded to Q10 (1.2 -> 1229/1024) its error added up over the steps of a
+deceleration ramp to 77 us at its slow end (1500 -> 50 rpm with 1.2).
+
+Conversions of the constructor arguments (to_q, rpm_to_freq_q) and the setup
+of a ramp may use larger integers, they only run at start-up.
+"""
+
+FREQ_SHIFT = 10
+PERIOD_SHIFT = 4
+FACTOR_SHIFT = 10
+FACTOR_ONE = 1 << FACTOR_SHIFT
+CORRECTION_SHIFT = 20
+CORRECTION_ONE = 1 << CORRECTION_SHIFT
+RAMP_SHIFT = FREQ_SHIFT - PERIOD_SHIFT # frequencies inside calc_ramp in 1/64 Hz
+US_Q = 1_000_000 << FREQ_SHIFT # 1 s in us, scaled for period = US_Q // freq_q (< 2**30)
+
+
+def to_q(value, shift):
+    """Converts a number (int or float, only used at start-up) to a scaled integer."""
+    return int(value * (1 << shift) + 0.5)
+
+def rpm_to_freq_q(rpm, steps_per_rev):
+    """Returns the step frequency in 1/1024 Hz for rpm revolutions per minute."""
+    return steps_per_rev * to_q(rpm, FREQ_SHIFT) // 60
+
+def freq_to_period_us(freq_q):
+    """Returns the period time in us of a frequency in 1/1024 Hz (truncated like int(1e6 / freq))."""
+    return US_Q // freq_q
+
+def freq_to_period_q(freq_q):
+    """Returns the period time in 1/16 us of a frequency in 1/1024 Hz."""
+    period, rest = divmod(US_Q, freq_q)
+    return (period << PERIOD_SHIFT) + (rest << PERIOD_SHIFT) // freq_q
+
+def isqrt(n):
+    """Returns the integer square root (rounded down) of 0 <= n < 2**30, bit by bit without floats."""
+    root = 0
+    bit = 1 << 28
+    while bit > n:
+        bit >>= 2
+    while bit:
+        if n >= root + bit:
+            n -= root + bit
+            root = (root >> 1) + bit
+        else:
+            root >>= 1
+        bit >>= 2
+    return root
+
+def calc_ramp(freq_start_q, freq_end_q, ramp_time, correction = CORRECTION_ONE):
+    """
+    Calculates a ramp from freq_start_q to freq_end_q (in 1/1024 Hz) within the ramp_time (in ms),
+    integer version of Stepper.calc_ramp.
+
+    The float version advances the time by the doubled period y = k * 1e6 / f and evaluates
+    f = b + m * t again, so every step changes the frequency by 2 * m * y = a / f with the
+    constant a = 2000 * k * (freq_end - freq_start) / ramp_time (in Hz**2). Here f is kept
+    in 1/64 Hz with the remainder of the division carried over to the next step. The correction
+    factor (Q20) enters a with full precision, the periods only need it in Q10.
+
+    Returns:
+    A list of integers of period times (in us) from freq_start to freq_end
+    """
+    f = freq_start_q >> (FREQ_SHIFT - RAMP_SHIFT)
+    a = (2000 * (freq_end_q - freq_start_q) * correction) // (ramp_time << (CORRECTION_SHIFT + FREQ_SHIFT - 2 * RAMP_SHIFT))
+    correction_q = (correction + (1 << (CORRECTION_SHIFT - FACTOR_SHIFT - 1))) >> (CORRECTION_SHIFT - FACTOR_SHIFT)
+    t_end = (ramp_time * 1000) << (PERIOD_SHIFT - 1) # half of the ramp time, like x += 2 * y
+    period_times = []
+    rest = 0
+    t = 0
+    while t < t_end and f > 0:
+        y = (((US_Q + (f >> 1)) // f) * correction_q + (FACTOR_ONE >> 1)) >> FACTOR_SHIFT # rounded period in 1/16 us
+        period_times.append(y >> PERIOD_SHIFT)
+        t += y
+        rest += a
+        step, rest = divmod(rest, f)
+        f += step
+    return period_times
+
+
+def calc_ramp_float(freq_start, freq_end, ramp_time, correction = 1.0):
+    """Float reference, identical to Stepper.calc_ramp."""
+    t_ramp = ramp_time * 1000
+    m = (freq_end - freq_start) / t_ramp
+    b = freq_start
+    x = 0
+    period_times = []
+    while x < t_ramp:
+        y = 1e6 / (m * x + b) * correction
+        period_times.append(int(y))
+        x += 2 * y
+    return period_times
+
+
+if __name__ == "__main__":
+    # compare the integer ramps with the float reference, fails beyond the bounds of the module docstring
+    for steps_per_rev, rpm_lo, rpm_hi, up, dn, correction in [(800, 50, 600, 1200, 400, 1.0), (800, 50, 1500, 1000, 400, 1.2),
+                                                              (800, 100, 600, 500, 500, 1.06), (1600, 30, 300, 2000, 1000, 1.0)]:
+        f_lo = steps_per_rev * rpm_lo / 60
+        f_hi = steps_per_rev * rpm_hi / 60
+        f_lo_q = rpm_to_freq_q(rpm_lo, steps_per_rev)
+        f_hi_q = rpm_to_freq_q(rpm_hi, steps_per_rev)
+        k_q = to_q(correction, CORRECTION_SHIFT)
+        for name, ref, fix in [("up", calc_ramp_float(f_lo, f_hi, up, correction), calc_ramp(f_lo_q, f_hi_q, up, k_q)),
+                               ("dn", calc_ramp_float(f_hi, f_lo, dn, correction), calc_ramp(f_hi_q, f_lo_q, dn, k_q))]:
+            n = min(len(ref), len(fix))
+            error = max([abs(ref[i] - fix[i]) for i in range(n)])
+            print("%4d %4d %4d %s steps float %5d int %5d  max period error %d us" % (steps_per_rev, rpm_lo, rpm_hi, name, len(ref), len(fix), error))
+            assert abs(len(ref) - len(fix)) <= 1, "number of steps"
+            assert error <= 1, "period error above 1 us"
+        print("     period_hi float %d int %d" % (int(1e6 / f_hi), freq_to_period_us(f_hi_q)))
+        assert int(1e6 / f_hi) == freq_to_period_us(f_hi_q), "period_hi"
+    print("ok")
@@ -0,0 +1,159 @@
+"""
+Micropython module for sharing one I2C bus between several device drivers.
+
+Every device queues its writes in its own preallocated buffer. Consecutive
+writes merge into one transfer, a delay (e.g. the 5 ms of the LCD clear command)
+only blocks the device which requested it: while it runs, the bus serves the
+other devices. Devices with a higher priority are served first, reads are done
+at once after the queued writes of the same device.
+"""
+from array import array
+from Compat import ticks_us, ticks_diff, ticks_add, sleep_us
+
+SEGMENTS = 16 # transfers which can be queued per device
+
+
+class I2cDevice:
+    """Handle of a device on the bus, created by I2cBus.device()."""
+
+    def __init__(self, bus, addr, priority, size):
+        self.bus = bus
+        self.addr = addr
+        self.priority = priority
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.length = 0                       # queued bytes
+        self.ends = array("i", [0] * SEGMENTS)   # end of every transfer in buf
+        self.delays = array("i", [0] * SEGMENTS) # delay after every transfer in us
+        self.segments = 0
+        self.ready_us = ticks_us()            # no transfer before this time
+        self.errors = 0                       # transfers without ACK
+
+    def write(self, data):
+        """Queues bytes, they merge with the last queued transfer if there is no delay in between."""
+        n = len(data)
+        if self.length + n > len(self.buf) or self.segments == SEGMENTS:
+            self.bus.flush(self)
+        length = self.length
+        self.mv[length:length + n] = data
+        self.length = length + n
+        segments = self.segments
+        if segments and self.delays[segments - 1] == 0:
+            self.ends[segments - 1] = self.length
+        else:
+            self.ends[segments] = self.length
+            self.delays[segments] = 0
+            self.segments = segments + 1
+
+    def delay_us(self, us):
+        """The next transfer to this device waits at least us after the queued ones."""
+        if self.segments:
+            self.delays[self.segments - 1] += us
+        else:
+            ready = ticks_add(ticks_us(), us)
+            if ticks_diff(ready, self.ready_us) > 0:
+                self.ready_us = ready
+
+    def pending(self):
+        return self.segments
+
+    def flush(self):
+        self.bus.flush(self)
+
+    def read_into(self, buf):
+        """Sends the queued writes of this device and reads len(buf) bytes."""
+        self.bus.flush(self)
+        self.bus.wait(self)
+        self.bus.i2c.readfrom_into(self.addr, buf)
+
+    def read_mem_into(self, reg, buf):
+        """Sends the queued writes of this device and reads len(buf) bytes from the register reg."""
+        self.bus.flush(self)
+        self.bus.wait(self)
+        self.bus.i2c.readfrom_mem_into(self.addr, reg, buf)
+
+    def send(self):
+        """Sends the first queued transfer, only called by the bus."""
+        end = self.ends[0]
+        try:
+            self.bus.i2c.writeto(self.addr, self.mv[:end])
+        except OSError: # no ACK, the transfer is dropped
+            self.errors += 1
+            self.bus.errors += 1
+        self.ready_us = ticks_add(ticks_us(), self.delays[0])
+        rest = self.length - end
+        if rest:
+            self.mv[:rest] = self.mv[end:self.length]
+        self.length = rest
+        self.segments -= 1
+        for i in range(self.segments):
+            self.ends[i] = self.ends[i + 1] - end
+            self.delays[i] = self.delays[i + 1]
+
+
+class I2cBus:
+    """Transaction scheduler for a machine.I2C shared by several devices."""
+
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.devices = [] # sorted by priority, highest first
+        self.errors = 0   # transfers without ACK
+
+    def device(self, addr, priority = 0, size = 256):
+        """
+        Registers a device.
+
+        addr: int, I2C address
+        priority: int, devices with higher values are served first, e.g. sensors before displays
+        size: int, bytes which can be queued
+
+        Returns:
+        An I2cDevice
+        """
+        device = I2cDevice(self, addr, priority, size)
+        self.devices.append(device)
+        self.devices.sort(key = lambda d: -d.priority)
+        return device
+
+    def poll(self):
+        """
+        Sends one transfer of the device with the highest priority which is ready.
+
+        Returns:
+        True if a transfer was sent
+        """
+        now = ticks_us()
+        for device in self.devices:
+            if device.segments and ticks_diff(now, device.ready_us) >= 0:
+                device.send()
+                return True
+        return False
+
+    def pending(self):
+        return sum([device.segments for device in self.devices])
+
+    def wait(self, device):
+        """Waits until the delay of device is over, serving the other devices meanwhile."""
+        while ticks_diff(device.ready_us, ticks_us()) > 0:
+            if not self.poll():
+                sleep_us(50)
+
+    def flush(self, device = None):
+        """Sends the queued transfers of device (default: of all devices), serving the others meanwhile."""
+        while (device.segments if device else self.pending()):
+            if not self.poll():
+                sleep_us(50)
+
+
+if __name__ == "__main__":
+    # LCD and a second device on the same bus
+    from machine import Pin, I2C
+    from lcd_pico import I2cLcd
+    bus = I2cBus(I2C(0, scl=Pin(1), sda=Pin(0), freq=400000))
+    sensor = bus.device(0x48, priority = 1) # e.g. a temperature sensor
+    lcd = I2cLcd(bus, 39, 2, 16)
+    lcd.putstr("Hello World")
+    data = bytearray(2)
+    sensor.read_into(data) # served while the LCD waits for its delays
+    lcd.flush()
+    print(data, bus.errors)
@@ -0,0 +1,155 @@
+"""
+Micropython module for reading the hand encoder with pin interrupts instead of a polling thread.
+
+The hard interrupt handler runs on every edge of CLK and DT and only touches
+preallocated arrays, so it never allocates memory. Bouncing contacts are
+rejected by a state table: only transitions between neighbouring states of the
+gray code count, a bounce adds +1 and -1 and cancels out, a jump over two states
+is ignored. A click is a full cycle of four transitions. The optional callback
+runs later via micropython.schedule, outside of the interrupt. If the schedule
+queue is full, the next edge schedules it again.
+"""
+from array import array
+from Recorder import CH_ENCODER
+from Compat import ticks_ms, ticks_diff
+try:
+    from micropython import schedule
+    from machine import Pin
+    IRQ_EDGES = Pin.IRQ_RISING | Pin.IRQ_FALLING
+except ImportError: # host, replayed by replay.py
+    def schedule(function, arg):
+        function(arg)
+    IRQ_EDGES = 12
+
+# [maximum time since the last click in ms, count per click], like encoder_stepSpeed of main1.py
+STEP_SPEED = [[200, 1], [175, 2], [150, 3], [137, 4], [125, 5], [120, 6], [115, 7], [110, 8], [105, 9],
+              [100, 10], [95, 12], [90, 14], [85, 16], [80, 18], [75, 20], [50, 50], [25, 100], [20, 175],
+              [15, 275], [10, 550]]
+
+# direction of a transition, index: last state << 2 | state, state: clk << 1 | dt
+# turning right (dt low at the rising edge of clk): 00 -> 10 -> 11 -> 01 -> 00
+TRANSITIONS = array("b", [0, -1, 1, 0,
+                          1, 0, 0, -1,
+                          -1, 0, 0, 1,
+                          0, 1, -1, 0])
+
+# fields of the state array
+COUNT = 0       # accumulated count, including the acceleration
+STEPS = 1       # valid transitions since the last click
+LAST = 2        # last state of the pins
+LAST_TICKS = 3  # ticks_ms of the last click
+CLICKS = 4      # number of clicks, without acceleration
+PENDING = 5     # callback is scheduled
+MISSED = 6      # callback could not be scheduled (queue full), retried at the next edge
+STATE_SIZE = 7
+
+
+class IrqEncoder:
+    """Counts the clicks of a rotary encoder in a hard interrupt handler."""
+
+    def __init__(self, clk, dt, step_speed = STEP_SPEED, acceleration = True, on_click = None, recorder = None):
+        """
+        Initialize encoder
+
+        clk, dt: machine.Pin, inputs of the encoder
+        step_speed: list of [ms, count], fast clicks count more (see STEP_SPEED)
+        acceleration: bool, use step_speed, otherwise every click counts 1
+        on_click: function called with the count after clicks, scheduled outside of the interrupt
+        recorder: Recorder, receives the levels of both pins after every edge (channel CH_ENCODER)
+        """
+        self.clk = clk
+        self.dt = dt
+        self.speed_ms = array("i", [entry[0] for entry in step_speed])
+        self.speed_count = array("i", [entry[1] for entry in step_speed])
+        self.acceleration = acceleration
+        self.state = array("i", [0] * STATE_SIZE)
+        self.state[LAST] = (clk.value() << 1) | dt.value()
+        self.state[LAST_TICKS] = ticks_ms()
+        self.on_click = on_click
+        self.recorder = recorder
+        self._scheduled = self._run_callback # bound methods allocate, so create them once
+        handler = self._irq
+        clk.irq(handler, IRQ_EDGES, hard = True)
+        dt.irq(handler, IRQ_EDGES, hard = True)
+
+    def _irq(self, pin):
+        pins = (self.clk.value() << 1) | self.dt.value()
+        if self.recorder:
+            self.recorder.pin(CH_ENCODER, pins)
+        self.transition(pins, ticks_ms())
+
+    def transition(self, pins, now):
+        """
+        Evaluates a new state of the pins, called by the interrupt or by the replay with a virtual time.
+
+        pins: int, clk << 1 | dt
+        now: int, ticks_ms
+        """
+        state = self.state
+        if state[MISSED]:
+            self._notify()
+        direction = TRANSITIONS[(state[LAST] << 2) | pins]
+        state[LAST] = pins
+        if direction == 0:
+            return
+        steps = state[STEPS] + direction
+        if -4 < steps < 4:
+            state[STEPS] = steps
+            return
+        state[STEPS] = 0
+        count = 1
+        if self.acceleration:
+            delta = ticks_diff(now, state[LAST_TICKS])
+            speed_ms = self.speed_ms
+            i = 0
+            n = len(speed_ms)
+            while i < n:
+                if delta < speed_ms[i]:
+                    count = self.speed_count[i]
+                i += 1
+        state[LAST_TICKS] = now
+        state[COUNT] += count if steps > 0 else -count
+        state[CLICKS] += 1
+        self._notify()
+
+    def _notify(self):
+        state = self.state
+        if self.on_click and not state[PENDING]:
+            state[PENDING] = 1
+            try:
+                schedule(self._scheduled, 0)
+            except RuntimeError: # schedule queue full, the exception would be lost in the hard interrupt
+                state[PENDING] = 0
+                state[MISSED] = 1
+                return
+            state[MISSED] = 0
+
+    def _run_callback(self, arg):
+        self.state[PENDING] = 0
+        self.on_click(self.state[COUNT])
+
+    def pins(self):
+        """Returns the last levels of the pins, clk << 1 | dt."""
+        return self.state[LAST]
+
+    def value(self):
+        """Returns the count."""
+        return self.state[COUNT]
+
+    def clicks(self):
+        return self.state[CLICKS]
+
+    def set(self, count):
+        self.state[COUNT] = count
+
+    def close(self):
+        self.clk.irq(None)
+        self.dt.irq(None)
+
+
+if __name__ == "__main__":
+    import utime
+    encoder = IrqEncoder(Pin(16, Pin.IN), Pin(17, Pin.IN))
+    while True:
+        print(encoder.value(), encoder.clicks())
+        utime.sleep(1)
@@ -0,0 +1,178 @@
+"""
+Micropython module for jogging the car, e.g. with the hand encoder during maintenance.
+
+The target position may change at any time, e.g. with every click of the encoder.
+Instead of starting a move with its own ramps for every click, the follower runs
+short chunks of steps with a speed that is retargeted before every chunk: it
+accelerates towards the target, brakes in time to stop there and reverses only
+after braking. A burst of clicks just moves the target further, so nothing
+queues up. The arithmetic is integer only, with small integers which do not
+allocate on core 1.
+
+PIOStreamBackend keeps the step generator running after execute_steps returns,
+until the next chunk or halt(). The position is therefore taken from the counted
+pulses of the backend, so the steps between the chunks are not lost.
+"""
+from array import array
+
+from FixedPoint import FREQ_SHIFT, isqrt
+
+
+class JogFollower:
+    """Makes a Stepper follow a target position with limited speed and acceleration."""
+
+    def __init__(self, stepper, freq_min = None, freq_max = None, accel = 4000, chunk_ms = 10):
+        """
+        Initialize jog follower
+
+        stepper: Stepper, its backend and position are used
+        freq_min, freq_max: int (Hz), start/stop and maximum step frequency, default freq_lo and freq_hi of the stepper
+        accel: int (Hz/s)
+        chunk_ms: int, duration of the chunks, the target is checked between them
+        """
+        self.stepper = stepper
+        self.freq_min = freq_min or stepper.freq_lo >> FREQ_SHIFT
+        self.freq_max = freq_max or stepper.freq_hi >> FREQ_SHIFT
+        self.accel = accel
+        self.chunk_ms = chunk_ms
+        self.braking = (self.freq_max * self.freq_max - self.freq_min * self.freq_min) // (2 * accel) # steps from freq_max to freq_min
+        self.target = array("i", [stepper.position]) # written by the other core
+        self.freq = 0        # current speed, 0 = standing
+        self.direction = 1   # 1 or -1 while moving
+        self.origin = 0      # position at the start of the motion
+        self.counted = 0     # counted pulses of the backend at the start of the motion
+
+    def set_target(self, position):
+        self.target[0] = position
+
+    def moving(self):
+        return self.freq != 0
+
+    def done(self):
+        """Returns True if the car stands at the target."""
+        return self.freq == 0 and self.stepper.position == self.target[0]
+
+    def update(self):
+        """
+        Runs one chunk of steps towards the target, call it repeatedly.
+
+        Returns:
+        The number of performed steps, negative for left turns, 0 if the target is reached
+        """
+        stepper = self.stepper
+        distance = self.target[0] - stepper.position
+        freq = self.freq
+        if freq == 0:
+            if distance == 0:
+                return 0
+            self.direction = 1 if distance > 0 else -1
+            stepper.set_direction(distance > 0)
+            self.origin = stepper.position
+            self.counted = stepper.backend.counted()
+            if stepper.power_policy: stepper.power_policy.before_move()
+        ahead = distance * self.direction # way left in the direction of motion, negative after passing the target
+        dv = self.accel * self.chunk_ms // 1000
+        if ahead > 0:
+            # fastest speed which still allows braking to freq_min at the target, below 2**30 for isqrt
+            if ahead >= self.braking:
+                limit = self.freq_max
+            else:
+                limit = min(self.freq_max, isqrt(self.freq_min * self.freq_min + 2 * self.accel * ahead))
+            freq = min(freq + dv, limit) if freq < limit else max(freq - dv, limit)
+            freq = max(freq, self.freq_min)
+        else:
+            freq -= dv
+            if freq < self.freq_min or (ahead == 0 and freq == self.freq_min): # target passed or reached: stop, reverse in the next chunk
+                return self.stop()
+        steps = max(1, freq * self.chunk_ms // 1000)
+        if ahead > 0:
+            steps = min(steps, ahead)
+        moved = self.run_chunk(steps, freq)
+        if self.freq and stepper.position == self.target[0] and freq <= self.freq_min:
+            moved += self.stop()
+        return moved
+
+    def run_chunk(self, steps, freq):
+        """
+        Runs steps with the frequency freq (Hz), stops if the stop pin is low.
+
+        Returns:
+        The change of the position
+        """
+        stepper = self.stepper
+        performed = stepper.backend.execute_steps(steps, 1_000_000 // freq)
+        moved = self.reconcile(performed)
+        self.freq = freq
+        if performed != steps: # stop pin
+            moved += self.stop()
+            self.target[0] = stepper.position
+        return moved
+
+    def brake(self):
+        """
+        Brakes with the acceleration down to freq_min and stops, e.g. before a command interrupts
+        the jogging. The target stays, the follower returns to it when jogging goes on.
+
+        Returns:
+        The change of the position
+        """
+        moved = 0
+        dv = self.accel * self.chunk_ms // 1000
+        freq = self.freq - dv
+        while self.freq and freq >= self.freq_min:
+            moved += self.run_chunk(max(1, freq * self.chunk_ms // 1000), freq)
+            freq -= dv
+        return moved + self.stop()
+
+    def reconcile(self, performed):
+        """
+        Updates the position of the stepper after a chunk with performed steps, from the counted
+        pulses if the backend counts them.
+
+        Returns:
+        The change of the position
+        """
+        stepper = self.stepper
+        counted = stepper.backend.counted()
+        if counted is None: # the backend stops with the chunk
+            moved = performed * self.direction
+        else:
+            moved = self.origin + (counted - self.counted) * self.direction - stepper.position
+        stepper.position += moved
+        return moved
+
+    def stop(self):
+        """
+        Stops at once, without ramp (see brake()).
+
+        Returns:
+        The change of the position by the steps emitted since the last chunk
+        """
+        moved = 0
+        if self.freq:
+            self.freq = 0
+            self.stepper.backend.halt()
+            moved = self.reconcile(0)
+            if self.stepper.power_policy: self.stepper.power_policy.after_move()
+        return moved
+
+
+if __name__ == "__main__":
+    # jog on the host: the target jumps like a fast burst of encoder clicks
+    from Stepper import Stepper
+    from StepperBackends import SimulatedBackend, SimPin
+    backend = SimulatedBackend()
+    m1 = Stepper(SimPin(), SimPin(), SimPin(), 600, 50, 1200, 400, 800, backend, stop_pin = SimPin())
+    jog = JogFollower(m1)
+    jog.set_target(3000)
+    chunks = 0
+    while True:
+        performed = jog.update()
+        chunks += 1
+        if chunks == 20:
+            jog.set_target(-500) # reverse in the middle of the move
+        if chunks == 10:
+            print("brake at %d Hz: %d steps" % (jog.freq, jog.brake())) # like a command while jogging
+        if jog.done():
+            break
+    print("position %d after %d chunks, %d steps, %.3f s" % (m1.position, chunks, backend.steps, backend.time_us / 1e6))
@@ -0,0 +1,128 @@
+"""
+Micropython module for runtime metrics of the controller.
+
+All metrics are created at start-up, updating them does not allocate memory.
+Print a compact snapshot in the REPL with metrics.report().
+"""
+from array import array
+import gc
+from Compat import ticks_us, ticks_ms, ticks_diff
+
+US_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000) # upper limits for durations in us
+
+
+class Counter:
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def inc(self, n = 1):
+        self.value += n
+
+    def text(self):
+        return "%s=%d" % (self.name, self.value)
+
+
+class Gauge:
+    """Last value together with the minimum and maximum since start."""
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self.min = 0
+        self.max = 0
+        self.valid = False
+
+    def set(self, value):
+        self.value = value
+        if not self.valid:
+            self.min = self.max = value
+            self.valid = True
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def text(self):
+        return "%s=%d[%d..%d]" % (self.name, self.value, self.min, self.max)
+
+
+class Histogram:
+    """Counts values into fixed buckets, the last bucket takes everything above the highest limit."""
+
+    def __init__(self, name, buckets = US_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.counts = array("I", [0] * (len(buckets) + 1))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def observe(self, value):
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+        i = 0
+        for limit in self.buckets:
+            if value < limit:
+                break
+            i += 1
+        self.counts[i] += 1
+
+    def text(self):
+        mean = self.total // self.count if self.count else 0
+        return "%s=%d/%d/%d/%d|%s" % (self.name, self.count, self.min, mean, self.max,
+                                      ",".join([str(c) for c in self.counts]))
+
+
+class Registry:
+    """Holds all metrics and renders the snapshot."""
+
+    def __init__(self):
+        self.metrics = []
+        self.start_ms = ticks_ms()
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name):
+        return self.add(Counter(name))
+
+    def gauge(self, name):
+        return self.add(Gauge(name))
+
+    def histogram(self, name, buckets = US_BUCKETS):
+        return self.add(Histogram(name, buckets))
+
+    def get(self, name):
+        for metric in self.metrics:
+            if metric.name == name:
+                return metric
+        return None
+
+    def snapshot(self):
+        """
+        Returns:
+        One line with the uptime and all metrics, histograms as count/min/mean/max|bucket counts
+        """
+        return " ".join(["t=%d" % ticks_diff(ticks_ms(), self.start_ms)] + [m.text() for m in self.metrics])
+
+    def report(self):
+        print(self.snapshot())
+
+    def collect_gc(self, histogram = None):
+        """Runs the garbage collector and records the pause in the histogram gc_pause_us."""
+        if histogram is None:
+            histogram = self.get("gc_pause_us") or self.histogram("gc_pause_us")
+        t = ticks_us()
+        gc.collect()
+        histogram.observe(ticks_diff(ticks_us(), t))
+
+
+# shared registry of the application
+metrics = Registry()
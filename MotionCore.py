@@ -0,0 +1,235 @@
+"""
+Micropython module for running the stepper motion on the second core of the Pico.
+
+Core 1 owns the stepper and feeds the PIO step generator, core 0 runs the
+display, the encoder and the dispatching. Both sides only talk via the
+preallocated slots of a Mailbox and the status array, so the motion core
+never allocates memory and is not disturbed by the garbage collector.
+"""
+from array import array
+from _thread import start_new_thread
+from Compat import sleep_us
+
+# commands (core 0 -> core 1)
+CMD_MOVE = 1      # arg: steps, negative for left turns
+CMD_PROFILE = 2   # arg: id of a profile registered with MotionCore.register_profile()
+CMD_POWER = 3     # arg: 1 = power on, 0 = power off
+CMD_QUIT = 4
+CMD_JOG = 5       # arg: 1 = follow the jog target, 0 = stop jogging
+CMD_JOG_TO = 6    # arg: target position, not posted (see jog_to), only recorded
+
+# status fields (core 1 -> core 0)
+STATE = 0         # STATE_IDLE, STATE_BUSY or STATE_QUIT
+POSITION = 1      # position in steps
+LAST_STEPS = 2    # performed steps of the last command
+DONE = 3          # number of finished commands
+ERRORS = 4        # number of failed commands
+STATUS_SIZE = 5
+
+STATE_IDLE = 0
+STATE_BUSY = 1
+STATE_QUIT = 2
+
+
+class Mailbox:
+    """
+    Ring buffer with a fixed number of command slots for one producer and one consumer.
+
+    The producer only writes head, the consumer only writes tail and the slot
+    is published by writing head after the slot data, so no lock is needed.
+    """
+
+    def __init__(self, slots = 8):
+        self.slots = slots
+        self.cmd = array("i", [0] * slots)
+        self.arg = array("i", [0] * slots)
+        self.head = 0
+        self.tail = 0
+
+    def post(self, cmd, arg = 0):
+        """
+        Puts a command into the next free slot.
+
+        Returns:
+        False if all slots are occupied
+        """
+        head = self.head
+        nxt = head + 1 if head + 1 < self.slots else 0
+        if nxt == self.tail:
+            return False
+        self.cmd[head] = cmd
+        self.arg[head] = arg
+        self.head = nxt
+        return True
+
+    def take(self):
+        """
+        Returns the index of the oldest occupied slot or -1 if the mailbox is empty.
+        The slot stays occupied until release() is called.
+        """
+        if self.tail == self.head:
+            return -1
+        return self.tail
+
+    def release(self):
+        """Frees the slot returned by take()."""
+        tail = self.tail
+        self.tail = tail + 1 if tail + 1 < self.slots else 0
+
+    def pending(self):
+        return (self.head - self.tail) % self.slots
+
+
+class MotionCore:
+    """Runs a Stepper on core 1 and executes the commands posted by core 0."""
+
+    def __init__(self, stepper, slots = 8, idle_sleep_us = 200, jog = None, supervisor = None, deadline_ms = 10000, recorder = None):
+        """
+        Initialize motion core
+
+        stepper: Stepper (with do_steps, run_profile, power_on and power_off), its power_policy is polled while idle,
+                 its stall_detector re-plans the moves after stalls
+        slots: int, number of command slots
+        idle_sleep_us: int, polling interval of the mailbox when there is nothing to do
+        jog: Jog.JogFollower, runs between the commands while jogging is on
+        supervisor: Supervisor, the loop reports its progress as task "motion"
+        deadline_ms: int, maximum time without progress, longer than the longest move or profile
+        recorder: Recorder, receives the posted commands and the jog targets for replay.py
+        """
+        self.stepper = stepper
+        self.mailbox = Mailbox(slots)
+        self.status = array("i", [0] * STATUS_SIZE)
+        self.profiles = []
+        self.idle_sleep_us = idle_sleep_us
+        self.jog_follower = jog
+        self.jogging = False
+        self.recorder = recorder
+        self.supervisor = supervisor
+        if supervisor:
+            self.task = supervisor.task("motion", deadline_ms)
+            supervisor.guard_stepper(stepper)
+
+    def register_profile(self, stream):
+        """
+        Registers a compiled command stream (see ProfileCompiler) before start().
+
+        Returns:
+        The id of the profile for CMD_PROFILE
+        """
+        self.profiles.append(stream)
+        return len(self.profiles) - 1
+
+    def start(self):
+        """Starts the motion loop on core 1."""
+        start_new_thread(self.run, ())
+
+    def post(self, cmd, arg = 0):
+        """Posts a command to core 1, see Mailbox.post()."""
+        posted = self.mailbox.post(cmd, arg)
+        if posted and self.recorder:
+            self.recorder.command(cmd, arg)
+        return posted
+
+    def move(self, steps):
+        return self.post(CMD_MOVE, steps)
+
+    def run_profile(self, profile_id):
+        return self.post(CMD_PROFILE, profile_id)
+
+    def power(self, on):
+        return self.post(CMD_POWER, 1 if on else 0)
+
+    def jog(self, on):
+        return self.post(CMD_JOG, 1 if on else 0)
+
+    def jog_to(self, position):
+        """Sets the target of the jog follower, coalesces bursts: only the last target counts."""
+        self.jog_follower.set_target(position)
+        if self.recorder:
+            self.recorder.command(CMD_JOG_TO, position)
+
+    def quit(self):
+        return self.post(CMD_QUIT)
+
+    def busy(self):
+        """Returns True while commands are queued or executed."""
+        return self.mailbox.pending() > 0 or self.status[STATE] == STATE_BUSY
+
+    def run(self):
+        """Motion loop, must only run on core 1."""
+        mailbox = self.mailbox
+        status = self.status
+        stepper = self.stepper
+        backend = stepper.backend
+        power = getattr(stepper, "power_policy", None)
+        stall = getattr(stepper, "stall_detector", None)
+        prepare = getattr(stepper, "prepare", None) # S-curves of Stepper.set_ramp_times(..., budget_us)
+        jog = self.jog_follower
+        supervisor = self.supervisor
+        while True:
+            if supervisor: supervisor.report(self.task)
+            slot = mailbox.take()
+            if slot < 0:
+                if prepare:
+                    prepare() # one time budget between the chunks, returns at once without request
+                if self.jogging and not jog.done() and not backend.faulted:
+                    status[POSITION] += jog.update()
+                    continue
+                if power: power.poll()
+                sleep_us(self.idle_sleep_us)
+                continue
+            cmd = mailbox.cmd[slot]
+            arg = mailbox.arg[slot]
+            if power and (cmd == CMD_MOVE or cmd == CMD_PROFILE):
+                power.wake() # as early as possible, the settle time overlaps the rest
+            status[STATE] = STATE_BUSY # before release, so busy() never sees a gap
+            mailbox.release()
+            if jog and jog.moving():
+                status[POSITION] += jog.brake() # commands interrupt the jogging, after a ramp down
+            if cmd == CMD_QUIT:
+                status[STATE] = STATE_QUIT
+                return
+            steps = 0
+            try:
+                if backend.faulted: # latched by the safe stop, no command may restart the motor
+                    self.jogging = False
+                    status[ERRORS] += 1
+                elif cmd == CMD_JOG:
+                    self.jogging = arg == 1
+                    jog.set_target(stepper.position)
+                elif cmd == CMD_MOVE:
+                    steps = stall.move(arg) if stall else stepper.do_steps(arg) # re-planned after a stall
+                elif cmd == CMD_PROFILE:
+                    steps = stepper.run_profile(self.profiles[arg])
+                elif cmd == CMD_POWER:
+                    if arg:
+                        stepper.power_on()
+                    else:
+                        stepper.power_off()
+            except Exception as e:
+                status[ERRORS] += 1
+                if supervisor: supervisor.fault(self.task, e) # motor stopped, the watchdog resets
+            status[POSITION] += steps
+            status[LAST_STEPS] = steps
+            status[DONE] += 1
+            status[STATE] = STATE_IDLE
+
+
+if __name__ == "__main__":
+    import utime
+    from machine import Pin
+    from Stepper import Stepper
+    from PowerPolicy import PowerPolicy
+
+    m1 = Stepper(Pin(2), Pin(3), Pin(4), 600, 50, 1200, 400, 800, power_policy = PowerPolicy(idle_ms = 2000))
+    motion = MotionCore(m1)
+    motion.start()
+    for i in range(5):
+        for steps in (8000, -8000):
+            while not motion.move(steps): # all slots occupied
+                utime.sleep_ms(10)
+    while motion.busy():
+        print(motion.status[POSITION], motion.status[DONE])
+        utime.sleep_ms(500)
+    motion.power(False)
+    motion.quit()
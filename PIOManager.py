@@ -0,0 +1,143 @@
+"""
+Micropython module for sharing the state machines and instruction memory of both PIO blocks.
+
+Each PIO has 4 state machines and 32 words of instruction memory. Micropython loads a
+program once per PIO and reuses it for every state machine started with the same
+program object, so the manager prefers a PIO which holds the program already and
+otherwise the one with the most free memory. Resources are released by release(),
+close() of the claim or at the end of a with block.
+
+The programs of the modules are declared with lazy_asm_pio, so they are only
+assembled when the first state machine with them is claimed.
+"""
+import rp2
+from rp2 import StateMachine
+
+NUM_PIOS = 2
+SMS_PER_PIO = 4
+INSTRUCTION_WORDS = 32
+
+
+def lazy_asm_pio(**kwargs):
+    """
+    Decorator like rp2.asm_pio (with the same keyword arguments), but the program is
+    assembled on the first call of the decorated name and then cached, so importing
+    a module costs nothing and every call returns the same program object.
+    """
+    def decorate(function):
+        cache = []
+        def program():
+            if not cache:
+                cache.append(rp2.asm_pio(**kwargs)(function))
+            return cache[0]
+        return program
+    return decorate
+
+
+class Claim:
+    """A claimed state machine, usable as context manager."""
+
+    def __init__(self, manager, smID, program):
+        self.manager = manager
+        self.smID = smID
+        self.program = program
+        self.sm = StateMachine(smID)
+
+    def close(self):
+        if self.manager:
+            self.manager.release(self)
+            self.manager = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class PIOManager:
+    def __init__(self):
+        self.claims = [None] * (NUM_PIOS * SMS_PER_PIO)
+        # per PIO: list of [program, number of claims]
+        self.programs = [[] for i in range(NUM_PIOS)]
+
+    def program_size(self, program):
+        return len(program[0]) # instruction words of an @asm_pio program
+
+    def free_words(self, pio):
+        return INSTRUCTION_WORDS - sum([self.program_size(entry[0]) for entry in self.programs[pio]])
+
+    def free_sms(self, pio):
+        return [smID for smID in range(pio * SMS_PER_PIO, (pio + 1) * SMS_PER_PIO) if self.claims[smID] is None]
+
+    def _entry(self, pio, program):
+        for entry in self.programs[pio]:
+            if entry[0] is program:
+                return entry
+        return None
+
+    def claim(self, program, smID = None, **kwargs):
+        """
+        Claims a state machine and initialises it with program and the keyword arguments of
+        StateMachine.init (freq, set_base, in_base, ...).
+
+        smID: int, a fixed state machine, otherwise one is chosen
+
+        Returns:
+        A Claim with the attributes sm and smID
+        """
+        if smID is None:
+            smID = self._choose(program)
+        elif self.claims[smID] is not None:
+            raise ValueError("state machine %d is already in use" % smID)
+        pio = smID // SMS_PER_PIO
+        entry = self._entry(pio, program)
+        if entry is None:
+            if self.program_size(program) > self.free_words(pio):
+                raise ValueError("not enough instruction memory in PIO %d" % pio)
+            entry = [program, 0]
+            self.programs[pio].append(entry)
+        entry[1] += 1
+        claim = Claim(self, smID, program)
+        self.claims[smID] = claim
+        claim.sm.init(program, **kwargs)
+        return claim
+
+    def _choose(self, program):
+        candidates = []
+        size = self.program_size(program)
+        for pio in range(NUM_PIOS):
+            sms = self.free_sms(pio)
+            if not sms:
+                continue
+            if self._entry(pio, program):
+                return sms[0] # program is loaded already
+            free = self.free_words(pio)
+            if free >= size:
+                candidates.append((free, sms[0]))
+        if not candidates:
+            raise ValueError("no state machine with enough instruction memory free")
+        candidates.sort()
+        return candidates[-1][1]
+
+    def release(self, claim):
+        """Stops the state machine and unloads the program when it is not used anymore."""
+        if self.claims[claim.smID] is not claim:
+            return
+        claim.sm.active(0)
+        self.claims[claim.smID] = None
+        pio = claim.smID // SMS_PER_PIO
+        entry = self._entry(pio, claim.program)
+        entry[1] -= 1
+        if entry[1] == 0:
+            self.programs[pio].remove(entry)
+            rp2.PIO(pio).remove_program(claim.program)
+
+    def status(self):
+        """Returns a list of (smID, program size or 0 if free) and the free words per PIO."""
+        sms = [(smID, self.program_size(claim.program) if claim else 0) for smID, claim in enumerate(self.claims)]
+        return sms, [self.free_words(pio) for pio in range(NUM_PIOS)]
+
+
+# shared manager of all modules
+manager = PIOManager()
@@ -0,0 +1,88 @@
+"""
+Micropython module for switching the stepper driver off while the elevator is idle.
+
+The driver sleeps after idle_ms without moves. The next move wakes it as early as
+possible (MotionCore wakes it when the command is taken, Stepper.do_steps before
+planning the move) and only waits for the rest of the settle time of the driver
+right before the first step. Optionally the ENABLE pin of the Easy Driver is
+driven with PWM between the moves, which lowers the holding current until the
+driver goes to sleep.
+"""
+from Compat import ticks_us, ticks_ms, ticks_diff, sleep_us
+
+SETTLE_US = 1000 # A3967 (Easy Driver) needs 1 ms after leaving the sleep mode
+
+
+class PowerPolicy:
+    """Sleeps the driver of a Stepper when idle and wakes it before moves."""
+
+    def __init__(self, idle_ms = 5000, settle_us = SETTLE_US, hold_pin = None, hold_duty = 1.0, hold_freq = 20000):
+        """
+        Initialize power policy
+
+        idle_ms: int, time without moves until the driver sleeps, None for never
+        settle_us: int, time between waking up and the first step
+        hold_pin: machine.Pin, ENABLE of the Easy Driver (low = outputs on), None if not connected
+        hold_duty: float, share of the time the outputs are on between the moves (1.0 = full holding current)
+        hold_freq: int (Hz), PWM frequency of hold_pin
+        """
+        self.idle_ms = idle_ms
+        self.settle_us = settle_us
+        self.stepper = None
+        self.pwm = None
+        self.hold_duty = int((1.0 - hold_duty) * 65535) # PWM duty of the inverted ENABLE pin
+        if hold_pin is not None:
+            from machine import PWM
+            self.pwm = PWM(hold_pin)
+            self.pwm.freq(hold_freq)
+            self.pwm.duty_u16(0) # outputs on
+        self.wake_us = ticks_us()
+        self.last_ms = ticks_ms()
+        self.moving = False
+
+    def attach(self, stepper):
+        """Called once by the Stepper."""
+        self.stepper = stepper
+
+    def asleep(self):
+        return self.stepper.slp.value() == 0
+
+    def wake(self):
+        """Leaves the sleep mode without waiting, the settle time runs while the move is planned, not after a fault."""
+        if self.stepper.backend.faulted:
+            return
+        if self.asleep():
+            self.stepper.power_on()
+            self.wake_us = ticks_us()
+        self.last_ms = ticks_ms()
+
+    def before_move(self):
+        """Waits for the rest of the settle time and switches to the full current."""
+        self.wake()
+        wait = self.settle_us - ticks_diff(ticks_us(), self.wake_us)
+        if wait > 0:
+            sleep_us(wait)
+        if self.pwm:
+            self.pwm.duty_u16(0)
+        self.moving = True
+
+    def after_move(self):
+        """Reduces the current to the holding current."""
+        if self.pwm:
+            self.pwm.duty_u16(self.hold_duty)
+        self.last_ms = ticks_ms()
+        self.moving = False
+
+    def poll(self):
+        """
+        Sends the driver to sleep when it was idle for idle_ms, call it from the idle loop.
+
+        Returns:
+        True if the driver sleeps
+        """
+        if self.asleep():
+            return True
+        if self.idle_ms is None or self.moving or ticks_diff(ticks_ms(), self.last_ms) < self.idle_ms:
+            return False
+        self.stepper.power_off()
+        return True
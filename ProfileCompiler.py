@@ -0,0 +1,260 @@
+"""
+Micropython module for compiling stepper moves into packed binary command streams
+"""
+import struct
+
+from FixedPoint import FREQ_SHIFT, to_q
+
+# A stream is a sequence of little endian 32 bit words.
+# The two highest bits select the command, the meaning of the rest depends on it:
+#   RUN:  bits 29..20 count (1..1023), bits 19..0 period time in us (as used by SMFrequency.set_period_us)
+#   DIR:  bit 0 direction (1 = right, like Stepper.set_direction)
+#   SYNC: bits 29..0 marker id, reported to the player's callback when reached
+#   END:  end of stream
+OP_RUN = 0
+OP_DIR = 1
+OP_SYNC = 2
+OP_END = 3
+
+MAX_COUNT = 0x3ff
+MAX_PERIOD = 0xfffff
+WORD_SIZE = 4
+
+
+def pack_run(period, count):
+    return (OP_RUN << 30) | (count << 20) | period
+
+def pack_dir(right):
+    return (OP_DIR << 30) | (1 if right else 0)
+
+def pack_sync(marker):
+    return (OP_SYNC << 30) | (marker & 0x3fffffff)
+
+def unpack(word):
+    """
+    Splits a command word.
+
+    Returns:
+    A tuple (op, a, b): (OP_RUN, period, count), (OP_DIR, right, 0), (OP_SYNC, marker, 0) or (OP_END, 0, 0)
+    """
+    op = word >> 30
+    if op == OP_RUN:
+        return op, word & MAX_PERIOD, (word >> 20) & MAX_COUNT
+    return op, word & 0x3fffffff, 0
+
+
+class ProfileCompiler:
+    """Compiles high level moves into a packed binary command stream."""
+
+    def __init__(self, freq_start, quantum = 1):
+        """
+        Initialize compiler
+
+        freq_start: float (Hz), start and stop frequency of every move (like Stepper.freq_lo)
+        quantum: int (us), period times are rounded to multiples of it, so neighbouring steps merge into one RUN command
+        """
+        self.freq_start = freq_start
+        self.quantum = quantum
+        self.position = 0
+        self.turn_right = None
+        self.buf = bytearray()
+        self._period = 0
+        self._count = 0
+
+    def move(self, target, vmax, accel, jerk = 0):
+        """
+        Appends a move to the absolute position target (in steps) with the maximum
+        frequency vmax (in Hz) and the acceleration accel (in Hz/s). With jerk (in Hz/s**2)
+        the ramps are S-curves (see SCurve), the move has the same number of steps.
+
+        Returns:
+        The number of steps of the move
+        """
+        steps = target - self.position
+        if steps == 0:
+            return 0
+        right = steps > 0
+        if right != self.turn_right:
+            self._flush()
+            self._word(pack_dir(right))
+            self.turn_right = right
+        steps = abs(steps)
+        vmax = max(vmax, self.freq_start)
+        if jerk:
+            for period in self._scurve(steps, vmax, accel, jerk):
+                self._step(period)
+            self.position = target
+            return steps
+        v0_sq = self.freq_start * self.freq_start
+        for i in range(steps):
+            # velocity is limited by the way accelerated from the start and the way left for braking
+            v_sq = v0_sq + 2 * accel * min(i, steps - 1 - i)
+            v = vmax if v_sq >= vmax * vmax else v_sq ** 0.5
+            self._step(int(1e6 / v))
+        self.position = target
+        return steps
+
+    def _scurve(self, steps, vmax, accel, jerk):
+        """
+        Returns the period times of a jerk limited move: S-curve up, cruise and the S-curve
+        down (the reversed one up). If both ramps do not fit into the steps, the highest peak
+        frequency whose ramps fit is searched by bisection.
+        """
+        from SCurve import calc_scurve
+        freq_start_q = to_q(self.freq_start, FREQ_SHIFT)
+        peak = vmax
+        ramp = calc_scurve(freq_start_q, to_q(peak, FREQ_SHIFT), int(accel), int(jerk), 1)
+        if 2 * len(ramp) > steps:
+            lo = self.freq_start
+            hi = vmax
+            peak = lo
+            ramp = []
+            while hi - lo > 1:
+                mid = (lo + hi) / 2
+                trial = calc_scurve(freq_start_q, to_q(mid, FREQ_SHIFT), int(accel), int(jerk), 1)
+                if 2 * len(trial) <= steps:
+                    lo = peak = mid
+                    ramp = trial
+                else:
+                    hi = mid
+        periods = list(ramp)
+        periods.extend([int(1e6 / peak)] * (steps - 2 * len(ramp)))
+        periods.extend(reversed(ramp))
+        return periods
+
+    def sync(self, marker):
+        """Appends a sync marker, e.g. for reaching a floor."""
+        self._flush()
+        self._word(pack_sync(marker))
+
+    def finish(self):
+        """
+        Terminates the stream.
+
+        Returns:
+        The command stream as bytearray
+        """
+        self._flush()
+        self._word(OP_END << 30)
+        return self.buf
+
+    def save(self, path):
+        """Writes the terminated stream to a file, e.g. into the flash of the Pico."""
+        with open(path, "wb") as f:
+            f.write(self.finish())
+
+    def _step(self, period):
+        q = self.quantum
+        period = min(max((period + q // 2) // q * q, 1), MAX_PERIOD)
+        if period != self._period or self._count == MAX_COUNT:
+            self._flush()
+            self._period = period
+        self._count += 1
+
+    def _flush(self):
+        if self._count:
+            self._word(pack_run(self._period, self._count))
+        self._count = 0
+
+    def _word(self, word):
+        self.buf.extend(struct.pack("<I", word))
+
+
+class ProfilePlayer:
+    """Feeds a compiled command stream to the pulse backend of a Stepper."""
+
+    def __init__(self, backend, set_direction, on_sync = None):
+        """
+        Initialize player
+
+        backend: StepperBackends.Backend, attached to the stop pin
+        set_direction: function called with True (right) or False for every DIR command, e.g. Stepper.set_direction,
+                       so the direction of the Stepper (turn_right) follows the stream
+        on_sync: function called with the marker id of every SYNC command
+        """
+        self.backend = backend
+        self.set_direction = set_direction
+        self.on_sync = on_sync
+        self.turn_right = True
+
+    def play(self, stream):
+        """
+        Executes a command stream (bytearray, bytes or memoryview).
+
+        Returns:
+        The number of performed steps, negative for left turns
+        """
+        self.performed_steps = 0
+        mv = memoryview(stream)
+        for offset in range(0, len(mv) - len(mv) % WORD_SIZE, WORD_SIZE):
+            if not self.execute(struct.unpack_from("<I", mv, offset)[0]):
+                break
+        self.backend.halt()
+        return self.performed_steps
+
+    def play_file(self, path, chunk_size = 256):
+        """
+        Streams a command file from flash through a preallocated buffer.
+
+        Returns:
+        The number of performed steps, negative for left turns
+        """
+        self.performed_steps = 0
+        buf = bytearray(chunk_size - chunk_size % WORD_SIZE)
+        mv = memoryview(buf)
+        running = True
+        with open(path, "rb") as f:
+            while running:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                for offset in range(0, n - n % WORD_SIZE, WORD_SIZE):
+                    running = self.execute(struct.unpack_from("<I", mv, offset)[0])
+                    if not running:
+                        break
+        self.backend.halt()
+        return self.performed_steps
+
+    def execute(self, word):
+        """
+        Executes a single command word.
+
+        Returns:
+        False if the stream ended or the stop pin was pulled low, otherwise True
+        """
+        op, a, b = unpack(word)
+        if op == OP_RUN:
+            performed = self.backend.execute_steps(b, a)
+            self.performed_steps += performed if self.turn_right else -performed
+            return performed == b
+        if op == OP_DIR:
+            self.turn_right = a == 1
+            self.set_direction(self.turn_right)
+        elif op == OP_SYNC:
+            if self.on_sync:
+                self.on_sync(a)
+        else:
+            return False
+        return True
+
+
+if __name__ == "__main__":
+    # precompile the floor to floor moves on the host into a directory, copy the files to the Pico
+    # 800 steps per revolution, 50 rpm start frequency, 600 rpm maximum frequency
+    import os
+    import sys
+    if len(sys.argv) != 2:
+        print("Usage: python ProfileCompiler.py output_directory")
+        sys.exit(1)
+    out = sys.argv[1]
+    os.makedirs(out, exist_ok = True)
+    floors = [0, 8000, 16000, 24000]
+    for start in range(len(floors)):
+        for end in range(len(floors)):
+            if start != end:
+                compiler = ProfileCompiler(freq_start = 800 * 50 / 60, quantum = 2)
+                compiler.position = floors[start]
+                compiler.move(floors[end], vmax = 800 * 600 / 60, accel = 8000, jerk = 50000)
+                compiler.sync(end)
+                compiler.save(os.path.join(out, "floor_%d_%d.bin" % (start, end)))
+                print(start, end, len(compiler.buf), "bytes")
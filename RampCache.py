@@ -0,0 +1,128 @@
+"""
+Micropython module for storing computed ramps and calibration data in the flash of the Pico
+"""
+import os
+import struct
+from array import array
+
+RAMP_MAGIC = b"ARP1"
+RAMP_VERSION = 4 # part of every ramp key, increase it with every change of the ramp generation (4: correction factor in Q20)
+CALIBRATION_MAGIC = b"ACL1"
+HEADER = "<4sII" # magic, key, number of entries
+HEADER_SIZE = struct.calcsize(HEADER)
+
+
+def fnv1a(data, h = 0x811c9dc5):
+    """32 bit FNV-1a hash of bytes, used as key of the cached parameters."""
+    for b in data:
+        h = ((h ^ b) * 0x01000193) & 0xffffffff
+    return h
+
+
+class RampCache:
+    """Persistent store for ramp tables and calibration values."""
+
+    def __init__(self, directory = "cache"):
+        self.directory = directory
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass # directory exists already
+
+    def ramp_key(self, freq_start, freq_end, ramp_time, correction):
+        """Returns the key of a ramp, any change of the parameters results in a new key."""
+        return fnv1a(struct.pack("<4sBdddd", RAMP_MAGIC, RAMP_VERSION, freq_start, freq_end, ramp_time, correction))
+
+    def torque_ramp_key(self, freq_start, freq_end, steps_per_rev, motor):
+        """Returns the key of a ramp of TorqueRamp.MotorCurve, including the torque curve."""
+        return fnv1a(motor.key(), fnv1a(struct.pack("<4sBddd", RAMP_MAGIC, RAMP_VERSION, freq_start, freq_end, steps_per_rev)))
+
+    def scurve_ramp_key(self, freq_start, freq_end, ramp_time, jerk):
+        """Returns the key of a jerk limited ramp of SCurve, different from ramp_key for the same numbers."""
+        return fnv1a(struct.pack("<4sBdddd", RAMP_MAGIC, RAMP_VERSION, freq_start, freq_end, ramp_time, jerk), fnv1a(b"scurve"))
+
+    def ramp_path(self, key):
+        return "%s/ramp_%08x.bin" % (self.directory, key)
+
+    def load_ramp(self, key, out = None):
+        """
+        Loads a ramp table with a single buffered read.
+
+        out: array('I') which is filled if it is large enough, otherwise a new array is allocated
+
+        Returns:
+        An array of period times (in us) or None if there is no valid table for key
+        """
+        try:
+            f = open(self.ramp_path(key), "rb")
+        except OSError:
+            return None
+        with f:
+            header = f.read(HEADER_SIZE)
+            if len(header) != HEADER_SIZE:
+                return None
+            magic, stored_key, count = struct.unpack(HEADER, header)
+            if magic != RAMP_MAGIC or stored_key != key:
+                return None
+            if out is None or len(out) < count:
+                out = array("I", bytes(4 * count)) # zeroed without a temporary list
+            if f.readinto(memoryview(out)[:count]) != 4 * count:
+                return None
+        return out if len(out) == count else out[:count]
+
+    def save_ramp(self, key, period_times):
+        """Stores a ramp table (list or array of period times in us)."""
+        with open(self.ramp_path(key), "wb") as f:
+            f.write(struct.pack(HEADER, RAMP_MAGIC, key, len(period_times)))
+            f.write(period_times if isinstance(period_times, array) else array("I", period_times))
+
+    def calibration_path(self):
+        return "%s/calibration.bin" % self.directory
+
+    def load_calibration(self):
+        """
+        Loads the calibration values.
+
+        Returns:
+        A dict of name: float, empty if nothing is stored
+        """
+        values = {}
+        try:
+            with open(self.calibration_path(), "rb") as f:
+                data = f.read()
+        except OSError:
+            return values
+        if len(data) < HEADER_SIZE:
+            return values
+        magic, key, count = struct.unpack_from(HEADER, data)
+        if magic != CALIBRATION_MAGIC or key != fnv1a(memoryview(data)[HEADER_SIZE:]):
+            return values
+        offset = HEADER_SIZE
+        for i in range(count):
+            length = data[offset]
+            name = str(data[offset + 1:offset + 1 + length], "utf-8")
+            offset += 1 + length
+            values[name] = struct.unpack_from("<d", data, offset)[0]
+            offset += 8
+        return values
+
+    def save_calibration(self, values):
+        """Stores a dict of name: float, e.g. {"ramp_correction_factor": 1.06, "rpm_hi": 600}."""
+        body = bytearray()
+        for name, value in values.items():
+            name = name.encode("utf-8")
+            body.append(len(name))
+            body.extend(name)
+            body.extend(struct.pack("<d", value))
+        with open(self.calibration_path(), "wb") as f:
+            f.write(struct.pack(HEADER, CALIBRATION_MAGIC, fnv1a(body), len(values)))
+            f.write(body)
+
+
+if __name__ == "__main__":
+    cache = RampCache()
+    cache.save_calibration({"ramp_correction_factor": 1.06, "rpm_hi": 600, "rpm_lo": 50})
+    print(cache.load_calibration())
+    key = cache.ramp_key(666.7, 8000, 1200, 1.06)
+    cache.save_ramp(key, [1500, 1400, 1300])
+    print(cache.load_ramp(key))
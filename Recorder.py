@@ -0,0 +1,138 @@
+"""
+Micropython module for recording the inputs of the controller on target, for replaying them on the host.
+
+Pin transitions (encoder CLK/DT, switch, stop pin) and the commands posted to
+the MotionCore are stored with ticks_us() in preallocated arrays, the pin
+handlers run in hard interrupts and never allocate. Unlike Tracer the buffer
+is linear: a replay has to start from the recorded initial levels, so a full
+buffer stops the recording. Replay the dumps on the host with replay.py.
+"""
+import struct
+from array import array
+from Compat import ticks_us, TICKS_PERIOD
+try:
+    from machine import disable_irq, enable_irq
+except ImportError: # host
+    def disable_irq():
+        return 0
+    def enable_irq(state):
+        pass
+
+# kinds of records
+REC_PIN = 1       # channel, level (CH_ENCODER: clk << 1 | dt)
+REC_CMD = 2       # command of MotionCore (CMD_*), argument
+
+# channels of REC_PIN
+CH_ENCODER = 0    # both pins of the encoder, recorded by IrqEncoder
+CH_SWITCH = 1     # switch of the encoder
+CH_STOP = 2       # stop pin of the stepper, if not the switch
+CH_USER = 8       # first channel for application pins
+
+MAGIC = b"ARC1"
+HEADER = "<4sHI"  # magic, dropped records (saturated), number of records
+RECORD = "<IBBi"  # ticks_us, kind, channel or command, level or argument
+
+
+class Recorder:
+    """Linear buffer of (ticks_us, kind << 8 | channel, value) records."""
+
+    def __init__(self, size = 4096):
+        """
+        Initialize recorder
+
+        size: int, number of records, 10 bytes each in the dump
+        """
+        self.size = size
+        self.ts = array("I", [0] * size)
+        self.code = array("H", [0] * size)
+        self.value = array("i", [0] * size)
+        self.count = 0
+        self.dropped = 0
+        self.enabled = False
+        self.pins = []    # (channel, pin) of watch(), their levels are recorded by start()
+
+    def watch(self, pin, channel):
+        """Records every edge of pin, the interrupt of pin must not be used otherwise."""
+        def handler(p):
+            self.add(REC_PIN, channel, p.value())
+        self.pins.append((channel, pin))
+        pin.irq(handler, pin.IRQ_RISING | pin.IRQ_FALLING, hard = True)
+
+    def start(self, levels = ()):
+        """
+        Starts a new recording with the current levels of the watched pins.
+
+        levels: list of (channel, level) of further inputs, e.g. (CH_ENCODER, encoder.pins())
+        """
+        self.count = 0
+        self.dropped = 0
+        self.enabled = True
+        for channel, pin in self.pins:
+            self.add(REC_PIN, channel, pin.value())
+        for channel, level in levels:
+            self.add(REC_PIN, channel, level)
+
+    def stop(self):
+        self.enabled = False
+
+    def add(self, kind, channel, value):
+        if self.enabled:
+            i = self.count
+            if i < self.size:
+                self.ts[i] = ticks_us()
+                self.code[i] = (kind << 8) | channel
+                self.value[i] = value
+                self.count = i + 1
+            else:
+                self.dropped += 1
+
+    def pin(self, channel, level):
+        self.add(REC_PIN, channel, level)
+
+    def command(self, cmd, arg = 0):
+        state = disable_irq() # the pin interrupts also append
+        self.add(REC_CMD, cmd, arg)
+        enable_irq(state)
+
+    def dump(self, path):
+        """Writes the records to a file."""
+        with open(path, "wb") as f:
+            self.write(f)
+
+    def write(self, stream):
+        stream.write(struct.pack(HEADER, MAGIC, min(self.dropped, 0xffff), self.count))
+        buf = bytearray(struct.calcsize(RECORD))
+        for i in range(self.count):
+            code = self.code[i]
+            struct.pack_into(RECORD, buf, 0, self.ts[i], code >> 8, code & 0xff, self.value[i])
+            stream.write(buf)
+
+
+def read_recording(path):
+    """
+    Reads a dump on the host.
+
+    Returns:
+    A list of (time in us since the first record, kind, channel or command, value) with unwrapped timestamps
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, _, n = struct.unpack_from(HEADER, data)
+    if magic != MAGIC:
+        raise ValueError("%s is not a recording" % path)
+    size = struct.calcsize(RECORD)
+    offset = struct.calcsize(HEADER)
+    records = []
+    t0 = None
+    last = None
+    wraps = 0
+    for i in range(n):
+        ts, kind, channel, value = struct.unpack_from(RECORD, data, offset + size * i)
+        if last is not None and ts < last:
+            wraps += 1 # ticks_us() wraps at 2**30
+        last = ts
+        t = ts + wraps * TICKS_PERIOD
+        if t0 is None:
+            t0 = t
+        records.append((t - t0, kind, channel, value))
+    return records
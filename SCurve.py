@@ -0,0 +1,163 @@
+"""
+Micropython module for jerk limited ramps (S-curves) with integer arithmetic.
+
+A linear ramp switches the acceleration on and off at once, the car jerks at the
+start and the end of every ramp. An S-curve raises the acceleration with the
+jerk limit, keeps it at the maximum and lowers it again before the end speed,
+so a move with cruise has seven segments. It is the fastest ramp within both
+limits. Every step lasts scale period times (1 for the backends and for
+ProfileCompiler, which emit one step per period time; 2 for the float convention
+of FixedPoint.calc_ramp), so it changes the frequency by scale * a / f and the
+acceleration by scale * jerk / f in the outer segments, with the remainders carried over to the next step. When the
+acceleration is lowered to 0 the ramp ends, a few Hz below the end frequency
+because of the step-wise integration:
+
+    frequencies: 1/64 Hz          (RAMP_SHIFT)
+    acceleration: Hz/s, below 2**16
+    jerk: Hz/s**2, below 2**22
+
+The generation is incremental: SCurveRamp.run(budget_us) returns after the time
+budget and continues with the next call, so it can run between the chunks of
+the feeder. A deceleration ramp is generated upwards and reversed, also in chunks.
+"""
+from array import array
+from math import sqrt
+
+from FixedPoint import FREQ_SHIFT, RAMP_SHIFT
+from Compat import ticks_us, ticks_diff
+
+US_RAMP = 1_000_000 << RAMP_SHIFT # 1 s in us, scaled for period = US_RAMP // f
+CHECK_STEPS = 16                  # steps between two checks of the time budget
+
+
+class SCurveRamp:
+    """Period table of a jerk limited ramp, generated in chunks."""
+
+    def __init__(self, freq_start_q, freq_end_q, accel, jerk, scale = 1):
+        """
+        Initialize S-curve
+
+        freq_start_q, freq_end_q: int (1/1024 Hz)
+        accel: int (Hz/s), maximum acceleration
+        jerk: int (Hz/s**2), maximum change of the acceleration
+        scale: int, period times per step
+        """
+        lo = min(freq_start_q, freq_end_q) >> (FREQ_SHIFT - RAMP_SHIFT)
+        hi = max(freq_start_q, freq_end_q) >> (FREQ_SHIFT - RAMP_SHIFT)
+        dv = hi - lo
+        ramp_dv = (accel * accel << RAMP_SHIFT) // jerk # speed change of raising and lowering the acceleration
+        if dv >= ramp_dv:
+            self.f_const = lo + ramp_dv // 2 # end of raising the acceleration
+            self.f_down = hi - ramp_dv // 2  # start of lowering the acceleration
+            self.a_max = accel
+        else: # the acceleration is lowered before reaching accel
+            self.f_const = self.f_down = lo + dv // 2
+            self.a_max = int(sqrt(dv * jerk / (1 << RAMP_SHIFT)))
+        self.jerk = (jerk * scale) << RAMP_SHIFT
+        self.accel_scale = scale << (2 * RAMP_SHIFT) # a * accel_scale / f is the change of f in 1/64 Hz
+        self.hi = hi
+        self.f = lo
+        self.a = 0
+        self.rest_f = 0
+        self.rest_a = 0
+        self.reverse = freq_end_q < freq_start_q
+        self.swapped = 0 # pairs swapped by the reversal
+        self.periods = array("I")
+        self.done = lo >= hi
+
+    def run(self, budget_us = None):
+        """
+        Generates the next steps of the ramp.
+
+        budget_us: int, returns after about this time, None for the whole ramp
+
+        Returns:
+        True if the ramp is complete (in self.periods)
+        """
+        start = ticks_us()
+        periods = self.periods
+        f = self.f
+        a = self.a
+        hi = self.hi
+        jerk = self.jerk
+        accel_scale = self.accel_scale
+        n = 0
+        while f < hi:
+            periods.append(US_RAMP // f)
+            if f < self.f_const or f >= self.f_down:
+                self.rest_a += jerk
+                da, self.rest_a = divmod(self.rest_a, f)
+                if f < self.f_const:
+                    a = min(a + da, self.a_max)
+                else:
+                    a -= da
+                    if a <= 0: # end of the ramp
+                        hi = self.hi = f
+                        break
+            self.rest_f += a * accel_scale
+            df, self.rest_f = divmod(self.rest_f, f)
+            f += df
+            n += 1
+            if budget_us is not None and n % CHECK_STEPS == 0 and ticks_diff(ticks_us(), start) >= budget_us:
+                self.f = f
+                self.a = a
+                return False
+        self.f = f
+        self.a = a
+        if self.reverse:
+            last = len(periods) - 1
+            i = self.swapped
+            while i < (last + 1) // 2:
+                periods[i], periods[last - i] = periods[last - i], periods[i]
+                i += 1
+                if budget_us is not None and i % (4 * CHECK_STEPS) == 0 and ticks_diff(ticks_us(), start) >= budget_us:
+                    self.swapped = i
+                    return False
+            self.swapped = i
+        self.done = True
+        return True
+
+
+def calc_scurve(freq_start_q, freq_end_q, accel, jerk, scale = 1):
+    """
+    Calculates a jerk limited ramp from freq_start_q to freq_end_q (in 1/1024 Hz) at once, see SCurveRamp.
+
+    Returns:
+    An array('I') of period times (in us) from freq_start to freq_end
+    """
+    ramp = SCurveRamp(freq_start_q, freq_end_q, accel, jerk, scale)
+    ramp.run()
+    return ramp.periods
+
+
+if __name__ == "__main__":
+    # 800 steps per revolution, 50 -> 600 rpm with 8000 Hz/s: linear ramp vs S-curves, one step per period time
+    from FixedPoint import calc_ramp, rpm_to_freq_q
+    f_lo = rpm_to_freq_q(50, 800)
+    f_hi = rpm_to_freq_q(600, 800)
+    linear = calc_ramp(f_lo, f_hi, 2 * (f_hi - f_lo) * 1000 // (8000 << FREQ_SHIFT)) # calc_ramp assumes two period times per step
+    print("linear      %5d steps %7d us" % (len(linear), sum(linear)))
+    for jerk in (200_000, 50_000, 10_000):
+        ramp = SCurveRamp(f_lo, f_hi, 8000, jerk)
+        chunks = 1
+        while not ramp.run(300):
+            chunks += 1
+        print("jerk %6d %5d steps %7d us, %d chunks of 300 us" % (jerk, len(ramp.periods), sum(ramp.periods), chunks))
+
+    # host check with Stepper: a move with S-curves is never slower than the linear move with the same ramp times
+    # plus the time accel / jerk which the jerk limit adds to each ramp, short moves do not crawl at rpm_lo
+    from Stepper import Stepper
+    from StepperBackends import SimulatedBackend, SimPin
+    def move_us(jerk, steps):
+        backend = SimulatedBackend()
+        stepper = Stepper(SimPin(), SimPin(), SimPin(), 600, 50, 1200, 400, 800, backend, stop_pin = SimPin(), jerk = jerk)
+        assert stepper.do_steps(steps) == steps
+        extra_us = 0
+        if jerk:
+            extra_us = (stepper.ramp_accel(f_lo, f_hi, 1200) + stepper.ramp_accel(f_hi, f_lo, 400)) * 1_000_000 // jerk
+        return backend.time_us, extra_us
+    for steps in (5, 100, 1000, 3000, 8000, 40000):
+        linear, _ = move_us(None, steps)
+        scurve, extra_us = move_us(50_000, steps)
+        print("move %5d steps: linear %8d us, jerk 50000 %8d us (limit %8d us)" % (steps, linear, scurve, linear + extra_us))
+        assert scurve <= linear + extra_us, "S-curve move slower than the linear move"
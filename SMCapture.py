@@ -0,0 +1,170 @@
+import utime
+from array import array
+from rp2 import PIO
+from PIOManager import manager, lazy_asm_pio
+from FastLoops import rxf_address
+
+CAPTURE_FREQ = 125_000_000 # cycles per second of the capture program
+OVERHEAD_CYCLES = 5        # cycles per period which do not decrement x, see PIO_CAPTURE
+
+@lazy_asm_pio(fifo_join=PIO.JOIN_RX)
+def PIO_CAPTURE():
+    """
+    This function uses a PIO (state machine) for recording the time of every rising edge of the jmp pin.
+    x counts down once per loop of 2 cycles while waiting for the low and the high level.
+    At a rising edge x is pushed into the fifo (8 entries, joined), a full fifo drops the timestamp.
+    A period between two rising edges takes 2 * (difference of the timestamps) + OVERHEAD_CYCLES cycles.
+    Run the program with 125 MHz, the resolution is 16 ns.
+    """
+    mov(x, invert(null))
+    wrap_target()
+    label("high")
+    jmp(pin, "high_dec")
+    jmp("low")
+    label("high_dec")
+    jmp(x_dec, "high")
+    jmp("high") # x wrapped, once in 68 s
+    label("low")
+    jmp(pin, "rise")
+    jmp(x_dec, "low")
+    jmp("low") # x wrapped
+    label("rise")
+    mov(isr, x)
+    push(noblock)
+    wrap()
+
+def to_intervals(stamps, n, out):
+    """
+    Converts n timestamps of PIO_CAPTURE into the n - 1 intervals between them (in cycles) in out.
+
+    Returns:
+    out
+    """
+    for i in range(n - 1):
+        out[i] = 2 * ((stamps[i] - stamps[i + 1]) & 0xffffffff) + OVERHEAD_CYCLES
+    return out
+
+class SMCapture:
+    """
+    Measures the periods of a step or encoder signal. capture() records a block of
+    intervals, poll() follows the signal continuously, e.g. for the encoder speed.
+    """
+
+    def __init__(self, smID = None, InputPin = None, dma = False):
+        """
+        smID: state machine, None for the next free one of PIOManager
+        InputPin: machine.Pin, may also be an output, e.g. the step pin
+        dma: bool, capture() lets a DMA channel (rp2.DMA) copy the timestamps instead of the CPU
+        """
+        self.pin = InputPin
+        self.claim = manager.claim(PIO_CAPTURE(), smID, freq = CAPTURE_FREQ, jmp_pin = self.pin)
+        self.sm = self.claim.sm
+        self.stamps = array("I")
+        self.last = None   # timestamp of the last edge seen by poll()
+        self.interval = 0  # last interval seen by poll() in cycles
+        self.dma = None
+        if dma:
+            from rp2 import DMA
+            smID = self.claim.smID
+            self.dma = DMA()
+            # DREQ of the RX fifo: 4..7 for PIO 0, 12..15 for PIO 1
+            self.dma_ctrl = self.dma.pack_ctrl(size = 2, inc_read = False, inc_write = True,
+                                               treq_sel = (4 if smID < 4 else 12) + smID % 4)
+        self.rxf = rxf_address(self.claim.smID)
+        self.sm.active(1)
+
+    def flush(self):
+        """Drops the timestamps waiting in the fifo."""
+        while self.sm.rx_fifo():
+            self.sm.get()
+
+    def capture(self, edges, out = None, timeout_ms = 1000):
+        """
+        Records the next rising edges.
+
+        edges: int, number of edges, the result has one interval less
+        out: array('I') of at least edges - 1 entries, reused instead of a new array
+        timeout_ms: int, maximum time of the whole capture
+
+        Returns:
+        out, an array('I') of the intervals in cycles of CAPTURE_FREQ, shorter if the timeout elapsed
+        """
+        if len(self.stamps) < edges:
+            self.stamps = array("I", bytes(4 * edges))
+        stamps = self.stamps
+        self.flush()
+        start = utime.ticks_ms()
+        n = 0
+        if self.dma:
+            dma = self.dma
+            dma.config(read = self.rxf, write = stamps, count = edges, ctrl = self.dma_ctrl, trigger = True)
+            while dma.active():
+                if utime.ticks_diff(utime.ticks_ms(), start) > timeout_ms:
+                    dma.active(0)
+                    break
+            n = edges - dma.count
+        else:
+            sm = self.sm
+            while n < edges:
+                if sm.rx_fifo():
+                    stamps[n] = sm.get()
+                    n += 1
+                elif utime.ticks_diff(utime.ticks_ms(), start) > timeout_ms:
+                    break
+        n = max(n, 1)
+        if out is None:
+            out = array("I", bytes(4 * (n - 1)))
+        elif len(out) > n - 1:
+            out = memoryview(out)[:n - 1]
+        return to_intervals(stamps, n, out)
+
+    def poll(self):
+        """
+        Reads the timestamps which arrived since the last poll, the last interval is kept in self.interval.
+
+        Returns:
+        The number of new edges
+        """
+        sm = self.sm
+        n = 0
+        while sm.rx_fifo():
+            stamp = sm.get()
+            if self.last is not None:
+                self.interval = 2 * ((self.last - stamp) & 0xffffffff) + OVERHEAD_CYCLES
+            self.last = stamp
+            n += 1
+        return n
+
+    def close(self):
+        if self.dma:
+            self.dma.close()
+            self.dma = None
+        self.claim.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+if __name__ == "__main__":
+    from machine import Pin
+    # jitter of the step generator: SMFrequency with a period of 500 us (250 us high, 250 us low),
+    # so the rising edges are 500 us apart
+    from SMFrequency import SMFrequency
+    period_us = 500
+    step_pin = Pin(2, Pin.OUT)
+    freq = SMFrequency(OutputPin = step_pin)
+    freq.set_period_us(period_us)
+    freq.active(1)
+    with SMCapture(InputPin = step_pin, dma = True) as capture:
+        intervals = capture.capture(200)
+        print("expected %d us: min %.3f us, max %.3f us, mean %.3f us" % (period_us,
+                                                         min(intervals) * 1e6 / CAPTURE_FREQ,
+                                                         max(intervals) * 1e6 / CAPTURE_FREQ,
+                                                         sum(intervals) * 1e6 / CAPTURE_FREQ / len(intervals)))
+    freq.active(0)
+    freq.close()
@@ -1,7 +1,8 @@
-from machine import Pin,Timer, PWM
-from rp2 import PIO, asm_pio, StateMachine
+from rp2 import asm_pio_encode
+from _thread import allocate_lock
+from PIOManager import manager, lazy_asm_pio
     
-@asm_pio()    
+@lazy_asm_pio()    
 def PIO_COUNTER():
     set(x,0)
     wrap_target()
@@ -11,26 +12,81 @@ def PIO_COUNTER():
     jmp(x_dec,'loop')
     wrap()
     
+# instructions for StateMachine.exec, encoded once by the first SMCounter instead of on every call
+INSTR = []
+
 class SMCounter:
+    """
+    Counts the rising edges of a pin. The state machine is never stopped for reading or
+    resetting: a single instruction copies x into the ISR, the counts are the differences
+    of these snapshots, extended from 32 bits to an unlimited logical count in Python.
+    Both cores may read it (e.g. the backend on core 1 and the StallDetector timer on
+    core 0), a lock keeps the snapshot and the update of total together.
+    """
     
-    def __init__(self, smID, InputPin):
+    def __init__(self, smID = None, InputPin = None):
+        """smID: state machine, None for the next free one of PIOManager"""
+        if not INSTR:
+            INSTR.append(asm_pio_encode("mov(isr, x)", 0))
+            INSTR.append(asm_pio_encode("push()", 0))
+        self.instr_mov_isr_x, self.instr_push = INSTR
         self.counter = 0x0
-        self.sm = StateMachine(smID)
         self.pin = InputPin
-        self.sm.init(PIO_COUNTER,freq=125_000_000,in_base=self.pin)
+        self.claim = manager.claim(PIO_COUNTER(), smID, freq=125_000_000, in_base=self.pin)
+        self.sm = self.claim.sm
         self.sm.active(1)
+        self.total = 0 # logical count since start
+        self.base = 0  # total at the last reset
+        self.lock = allocate_lock()
+    
+    def raw(self):
+        """Returns the 32 bit hardware count (x counts down from 0)."""
+        self.sm.exec(self.instr_mov_isr_x)
+        self.sm.exec(self.instr_push)
+        return (0x100000000 - self.sm.get()) & 0xffffffff
+    
+    def _update(self):
+        raw = self.raw()
+        self.total += (raw - self.counter) & 0xffffffff
+        self.counter = raw
+        return self.total
+    
+    def update(self):
+        """Adds the edges since the last read to total, must be called at least once per 2**32 edges."""
+        self.lock.acquire()
+        total = self._update()
+        self.lock.release()
+        return total
     
     def value(self):
-        self.sm.exec('mov(isr,x)')
-        self.sm.exec('push()')
-        self.counter = self.sm.get()
-        return  (0x100000000 - self.counter) & 0xffffffff
+        """Returns the number of edges since the last reset."""
+        self.lock.acquire()
+        count = self._update() - self.base
+        self.lock.release()
+        return count
+    
+    def snapshot_and_clear(self):
+        """Returns the number of edges since the last reset and resets the count, without a blind window."""
+        self.lock.acquire()
+        total = self._update()
+        count = total - self.base
+        self.base = total
+        self.lock.release()
+        return count
     
     def reset(self):
-        self.sm.active(0)
-        self.sm.init(PIO_COUNTER,freq=125_000_000,in_base=self.pin)
-        self.sm.active(1)
+        self.lock.acquire()
+        self.base = self._update()
+        self.lock.release()
         
+    def close(self):
+        self.claim.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def __del__(self):
-        self.sm.active(0)
\ No newline at end of file
+        self.close()
@@ -1,8 +1,7 @@
-import utime
-from rp2 import PIO, StateMachine, asm_pio
-from machine import Pin
+from rp2 import PIO
+from PIOManager import manager, lazy_asm_pio
 
-@asm_pio(set_init=PIO.OUT_LOW)
+@lazy_asm_pio(set_init=PIO.OUT_LOW)
 def PIO_FREQUENCY():
     """
     This function uses a PIO (state machine) for generating a reliable frequency.
@@ -37,10 +36,11 @@ def PIO_FREQUENCY():
     jmp(y_dec, "wait2")
     
 class SMFrequency:
-    def __init__(self, smID, OutputPin):
-        self.sm = StateMachine(smID)
+    def __init__(self, smID = None, OutputPin = None):
+        """smID: state machine, None for the next free one of PIOManager"""
         self.pin = OutputPin
-        self.sm.init(PIO_FREQUENCY, freq = 100_000_000, set_base = self.pin)
+        self.claim = manager.claim(PIO_FREQUENCY(), smID, freq = 100_000_000, set_base = self.pin)
+        self.sm = self.claim.sm
     
     def set_period_us(self, period_us):
         self.sm.put(period_us)
@@ -50,11 +50,24 @@ class SMFrequency:
         if active == 0:
             self.sm.exec("set(pins,0)")
         
+    def close(self):
+        if self.claim.manager:
+            self.sm.active(0)
+            self.sm.exec("set(pins,0)")
+        self.claim.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def __del__(self):
-        self.sm.active(0)
-        self.sm.exec("set(pins,0)")
+        self.close()
         
 if __name__ == "__main__":
+    import utime
+    from machine import Pin
     freq = SMFrequency(smID = 1, OutputPin = Pin(2, Pin.OUT))
     freq.set_period_us(500)
     freq.active(1)
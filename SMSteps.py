@@ -0,0 +1,82 @@
+from rp2 import PIO
+from PIOManager import manager, lazy_asm_pio
+
+@lazy_asm_pio(set_init=PIO.OUT_LOW)
+def PIO_STEPS():
+    """
+    This function uses a PIO (state machine) for generating an exact number of steps.
+    Use put() two times: the number of steps - 1 and then the half period time - 1.
+    One loop of the delays uses 10 cycles.
+    Run the program with a frequency of 10 MHz, so the half period time will be in us.
+    The PIO stops after the last step and waits for the next pair of values.
+    """
+    pull(block)
+    mov(x, osr)
+    pull(block)
+    label("step")
+    set(pins, 1)
+    mov(y, osr)
+    label("high")
+    jmp(y_dec, "high")  [9]
+    set(pins, 0)
+    mov(y, osr)
+    label("low")
+    jmp(y_dec, "low")   [9]
+    jmp(x_dec, "step")
+
+class SMSteps:
+    def __init__(self, smID = None, OutputPin = None):
+        """smID: state machine, None for the next free one of PIOManager"""
+        self.pin = OutputPin
+        self.claim = manager.claim(PIO_STEPS(), smID, freq = 10_000_000, set_base = self.pin)
+        self.sm = self.claim.sm
+
+    def put_steps(self, steps, period_us):
+        """
+        Queues steps with the period time period_us (high and low phase period_us / 2).
+        Blocks while the fifo is full, which paces the caller to the steps.
+        """
+        if steps > 0:
+            self.sm.put(steps - 1)
+            self.sm.put(max(period_us // 2 - 1, 0))
+
+    def pending(self):
+        """Returns the number of values in the fifo (two per put_steps)."""
+        return self.sm.tx_fifo()
+
+    def active(self, active):
+        self.sm.active(active)
+        if active == 0:
+            self.sm.exec("set(pins,0)")
+
+    def restart(self):
+        """Drops queued steps, used after a stop."""
+        self.sm.active(0)
+        while self.sm.tx_fifo():
+            self.sm.exec("pull(noblock)")
+        self.sm.restart()
+        self.sm.exec("set(pins,0)")
+
+    def close(self):
+        if self.claim.manager:
+            self.sm.active(0)
+            self.sm.exec("set(pins,0)")
+        self.claim.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+if __name__ == "__main__":
+    import utime
+    from machine import Pin
+    steps = SMSteps(smID = 2, OutputPin = Pin(2, Pin.OUT))
+    steps.active(1)
+    steps.put_steps(800, 500)
+    utime.sleep(1)
+    steps.active(0)
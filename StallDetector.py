@@ -0,0 +1,211 @@
+"""
+Micropython module for detecting lost steps of the stepper while it moves.
+
+A timer runs tick() every few milliseconds on core 0. It integrates the pulses
+counted by the backend (SMCounter on the step pin) with the direction and the
+microsteps per pulse (Stepper.segment, larger during a coarse cruise) into the
+emitted position and compares it with the position of a shaft encoder. A
+stalled motor stops following the pulses and the difference grows by four full
+steps per slipped electrical cycle; beyond the tolerance the detector pulls the
+stop pin low, which ends every step loop within one period. When the motion
+stands still, the position of the Stepper is corrected to the shaft and move()
+re-plans the rest of the move with lower acceleration. While idle the commanded
+position is also compared with the emitted pulses, which finds pulses lost
+between the planner and the pin.
+"""
+from Compat import sleep_ms
+
+
+class StallDetector:
+    """Stops the Stepper when the shaft encoder does not follow the counted steps."""
+
+    def __init__(self, feedback = None, counts_per_rev = 0, tolerance = None, period_ms = 2, idle_ticks = 2,
+                 backoff = 1.5, retries = 2, metrics = None):
+        """
+        Initialize stall detector
+
+        feedback: shaft encoder with value(), e.g. IrqEncoder(acceleration = False) or SMCounter, None for the pulse check only
+        counts_per_rev: int, counts of feedback per revolution
+        tolerance: int, allowed difference in microsteps, default 4 full steps plus two counts of feedback
+        period_ms: int, period of tick()
+        idle_ticks: int, ticks without pulses after which the motion counts as standing
+        backoff: float, factor of the ramp times after a stall
+        retries: int, re-planned attempts of a move
+        metrics: Metrics.Registry, receives the stalls, the lost pulses and the last stall error
+        """
+        self.feedback = feedback
+        self.counts_per_rev = counts_per_rev
+        self.tolerance = tolerance
+        self.period_ms = period_ms
+        self.idle_ticks = idle_ticks
+        self.backoff = backoff
+        self.retries = retries
+        self.stepper = None
+        self.timer = None
+        self.tripped = False
+        self.stalls = 0
+        self.error = 0 # difference of the last stall in microsteps
+        self.m_stalls = self.m_lost_pulses = self.m_stall_error = None
+        if metrics:
+            self.m_stalls = metrics.counter("stalls")
+            self.m_lost_pulses = metrics.counter("lost_pulses")
+            self.m_stall_error = metrics.gauge("stall_error")
+        self._tick = self.tick # bound methods allocate, so create it once
+
+    def attach(self, stepper):
+        """Called once by the Stepper."""
+        if stepper.backend.counted() is None:
+            raise ValueError("the stall detector needs a backend which counts the steps")
+        self.stepper = stepper
+        if self.tolerance is None:
+            self.tolerance = 4 * stepper.microsteps
+            if self.feedback:
+                self.tolerance += 2 * stepper.steps_per_rev // self.counts_per_rev
+        self.total = self.emitted()      # microsteps of the counted pulses
+        self.pulses = stepper.position   # emitted position
+        self.position = stepper.position # commanded position of the last tick
+        self.quiet = 0                   # ticks without pulses
+        if self.feedback:
+            self.feedback_base = self.feedback.value()
+            self.anchor = stepper.position
+
+    def start(self):
+        """Starts tick() with a periodic machine.Timer."""
+        from machine import Timer
+        self.timer = Timer(mode = Timer.PERIODIC, period = self.period_ms, callback = self._tick)
+
+    def stop(self):
+        if self.timer:
+            self.timer.deinit()
+            self.timer = None
+
+    def shaft(self):
+        """Returns the position of the shaft encoder in microsteps."""
+        return (self.feedback.value() - self.feedback_base) * self.stepper.steps_per_rev // self.counts_per_rev + self.anchor
+
+    def emitted(self):
+        """Returns the microsteps of all counted pulses, each one with the ratio of its segment."""
+        stepper = self.stepper
+        start, microsteps, ratio = stepper.segment # one read, the Stepper replaces it on core 1
+        return microsteps + ((stepper.backend.counted() - start) & 0xffffffff) * ratio
+
+    def tick(self, timer = None):
+        stepper = self.stepper
+        tolerance = self.tolerance
+        total = self.emitted()
+        delta = total - self.total
+        self.total = total
+        self.pulses += delta if stepper.turn_right else -delta
+        position = stepper.position
+        if delta or position != self.position:
+            self.quiet = 0
+        elif self.quiet < self.idle_ticks:
+            self.quiet += 1
+        self.position = position
+        if self.quiet < self.idle_ticks: # moving
+            if self.feedback and not self.tripped:
+                error = self.pulses - self.shaft()
+                if error > tolerance or error < -tolerance:
+                    self.trip(error)
+            return
+        if self.tripped:
+            self.recover()
+            return
+        lost = position - self.pulses
+        if lost > tolerance or lost < -tolerance:
+            if self.m_lost_pulses: self.m_lost_pulses.inc(abs(lost))
+        self.pulses = position
+        if self.feedback:
+            error = position - self.shaft()
+            if error > tolerance or error < -tolerance: # e.g. moved by the load while standing
+                self.trip(error)
+
+    def trip(self, error):
+        """Stops the motion with the stop pin."""
+        stop = self.stepper.stop
+        stop.init(stop.OUT, value = 0)
+        self.tripped = True
+        self.error = error
+        self.stalls += 1
+        if self.m_stalls:
+            self.m_stalls.inc()
+            self.m_stall_error.set(error)
+
+    def recover(self):
+        """Corrects the position of the Stepper to the shaft and releases the stop pin, the motion stands still."""
+        stepper = self.stepper
+        if self.feedback:
+            stepper.position = self.shaft()
+        self.pulses = self.position = stepper.position
+        stop = stepper.stop
+        stop.init(stop.IN, stop.PULL_UP)
+        self.tripped = False
+
+    def replan(self):
+        """
+        Lowers the acceleration of the Stepper by backoff.
+
+        Returns:
+        The parameters before, for restore()
+        """
+        stepper = self.stepper
+        saved = (stepper.ramp_up_time, stepper.ramp_dn_time, stepper.motor.margin if stepper.motor else None)
+        if stepper.motor:
+            stepper.motor.margin /= self.backoff # the ramps follow the torque curve
+        stepper.set_ramp_times(int(stepper.ramp_up_time * self.backoff), int(stepper.ramp_dn_time * self.backoff))
+        return saved
+
+    def restore(self, saved):
+        """Sets the ramps of the Stepper back to the parameters returned by replan()."""
+        stepper = self.stepper
+        ramp_up_time, ramp_dn_time, margin = saved
+        if stepper.motor:
+            stepper.motor.margin = margin
+        stepper.set_ramp_times(ramp_up_time, ramp_dn_time)
+
+    def move(self, steps):
+        """
+        Runs Stepper.do_steps, after a stall the rest of the move is re-planned with lower acceleration.
+        The original ramps are restored after the move, so a stall only slows down its own move. The
+        derated ramps are always the same few (backoff ** attempt), with a RampCache they are only
+        calculated and written once.
+
+        Returns:
+        The number of steps the shaft moved, negative for left turns
+        """
+        stepper = self.stepper
+        start = stepper.position
+        target = start + steps
+        attempt = 0
+        saved = None
+        while True:
+            stalls = self.stalls
+            stepper.do_steps(target - stepper.position)
+            while self.tripped: # tick() corrects the position once the motion stands still
+                sleep_ms(self.period_ms)
+            if self.stalls == stalls or stepper.position == target or attempt == self.retries:
+                break
+            attempt += 1
+            replanned = self.replan()
+            if saved is None:
+                saved = replanned
+        if saved:
+            self.restore(saved)
+        return stepper.position - start
+
+
+if __name__ == "__main__":
+    # shaft encoder with 20 clicks per revolution on GPIO 20/21
+    from machine import Pin
+    from IrqEncoder import IrqEncoder
+    from Stepper import Stepper
+    shaft = IrqEncoder(Pin(20, Pin.IN), Pin(21, Pin.IN), acceleration = False)
+    detector = StallDetector(shaft, 20)
+    m1 = Stepper(Pin(2), Pin(3), Pin(4), 600, 50, 300, 300, 800, stall_detector = detector)
+    detector.start()
+    m1.power_on()
+    for steps in (8000, -8000):
+        moved = detector.move(steps)
+        print("moved %d of %d steps, %d stalls, ramp up %d ms" % (moved, steps, detector.stalls, m1.ramp_up_time))
+    m1.power_off()
+    detector.stop()
@@ -1,152 +1,499 @@
-"""Micropython module for stepper motor driven by Easy Driver."""
-from machine import Pin
-from utime import sleep_us, sleep_ms, sleep, ticks_us, ticks_ms
+"""
+Micropython module for stepper motor driven by Easy Driver.
+
+Version 4 replaces Stepper.py (bit-banged), Stepper_v2.py (PIO) and Stepper_v3.py
+(SMFrequency/SMCounter). The pulses are generated by a backend from StepperBackends,
+which is chosen at construction.
+"""
+from array import array
+from FixedPoint import CORRECTION_SHIFT, FREQ_SHIFT, calc_ramp, freq_to_period_us, rpm_to_freq_q, to_q
+from Tracer import EV_MOVE_BEGIN, EV_MOVE_END, EV_RAMP_BEGIN, EV_RAMP_END, EV_STEPS_BEGIN, EV_STEPS_END
+
+__version__ = "4.0"
+
+STOP_PIN = 18
+# levels of MS1, MS2 of the Easy Driver for the microsteps per full step
+MICROSTEP_PINS = {1: (0, 0), 2: (1, 0), 4: (0, 1), 8: (1, 1)}
+
 
 class Stepper:
     """Class for stepper motor driven by Easy Driver."""
 
-    def __init__(self, step_pin, dir_pin, sleep_pin, rpm_hi, rpm_lo, ramp_up_time, ramp_dn_time, steps_per_rev):
+    def __init__(self, step_pin, dir_pin, sleep_pin, rpm_hi, rpm_lo, ramp_up_time, ramp_dn_time, steps_per_rev,
+                 backend = None, stop_pin = STOP_PIN, ramp_down = True, min_const_steps = 10,
+                 cache = None, tracer = None, metrics = None, motor = None,
+                 ms_pins = None, microsteps = 8, cruise_microsteps = None, power_policy = None, stall_detector = None,
+                 jerk = None):
         """
         Initialize stepper
-        
+
         step_pin, dir_pin, sleep_pin: machine.Pin
         rpm_hi, rpm_lo: float
         ramp_up_time, ramp_dn_time: int (ms)
         steps_per_rev)
+        backend: StepperBackends.Backend, default PIOStreamBackend on step_pin
+        stop_pin: int (GPIO with pull up) or machine.Pin, pulled low for stopping
+        ramp_down: bool, brake with a ramp (Stepper.py of version 1 had no ramp down)
+        min_const_steps: int, minimum number of steps at rpm_hi for using the ramps (version 1: 0)
+        cache: RampCache, stored calibration values override the arguments and ramps are loaded instead of calculated
+        tracer: Tracer, records moves, ramps and every step
+        metrics: Metrics.Registry, receives commanded, performed and counted steps and the overruns of the step loops
+        motor: TorqueRamp.MotorCurve, the ramps follow the torque of the motor, ramp_up_time and ramp_dn_time are ignored
+        ms_pins: (MS1, MS2) machine.Pin, microstep select of the Easy Driver, None if wired fixed
+        microsteps: int, microsteps per full step of steps_per_rev, all steps and positions are counted in them
+        cruise_microsteps: int, coarser resolution for the constant speed of long moves, None for no switching
+            (only with a backend of exact_steps, the others end at no defined pulse)
+        power_policy: PowerPolicy, sleeps the driver when idle and wakes it for the moves
+        stall_detector: StallDetector, stops the moves when the motor does not follow the steps (needs a counting backend)
+        jerk: int (Hz/s**2), S-curve ramps (see SCurve) with this jerk limit, the ramp times only set the maximum acceleration
         """
+        if backend is None:
+            from StepperBackends import PIOStreamBackend
+            backend = PIOStreamBackend(step_pin)
+        stop_mask = 0 # only known for a GPIO number, the viper loops need it
+        if isinstance(stop_pin, int):
+            from machine import Pin
+            stop_mask = 1 << stop_pin
+            stop_pin = Pin(stop_pin, Pin.IN, Pin.PULL_UP)
+        self.backend = backend
+        self.cache = cache
+        self.tracer = tracer
+        self.metrics = metrics
+        self.motor = motor
+        overruns = None
+        if metrics:
+            self.m_steps_commanded = metrics.counter("steps_commanded")
+            self.m_steps_performed = metrics.counter("steps_performed")
+            self.m_steps_counted = metrics.counter("steps_counted") # in microsteps like performed
+            self.m_counter_drift = metrics.gauge("counter_drift") # counted - performed steps
+            overruns = self.m_step_overruns = metrics.counter("step_overruns")
+        calibration = cache.load_calibration() if cache else {}
+        rpm_hi = calibration.get("rpm_hi", rpm_hi)
+        rpm_lo = calibration.get("rpm_lo", rpm_lo)
         self.stp = step_pin
         self.dir = dir_pin
         self.slp = sleep_pin
-        self.stop = Pin(18, Pin.IN, Pin.PULL_UP)
+        self.stop = stop_pin
+        self.ms_pins = ms_pins
+        self.microsteps = microsteps
+        self.cruise_microsteps = cruise_microsteps if ms_pins and backend.exact_steps else None
+        self.position = 0 # in microsteps
+        self.segment = (backend.counted() or 0, 0, 1) # counted pulse and microsteps at the last resolution change, microsteps per pulse since
+        self.coarse_extra = 0 # microsteps of the last move beyond one per pulse, by the coarse cruise
+        self.power_policy = power_policy
+        self.stall_detector = stall_detector
+        self.jerk = jerk
+        self.pending = None # latest S-curves of set_ramp_times, generated by prepare()
+        self.requests = 0   # number of set_ramp_times with budget, only written by set_ramp_times
+        self.prepared = 0   # requests whose ramps are in use, only written by prepare()
 
-        self.stp.init(Pin.OUT)
-        self.dir.init(Pin.OUT)
-        self.slp.init(Pin.OUT)
+        self.dir.init(self.dir.OUT)
+        self.slp.init(self.slp.OUT)
+        if ms_pins:
+            for pin in ms_pins:
+                pin.init(pin.OUT)
+            self.set_resolution(microsteps)
+        backend.attach(stop_pin, stop_mask, tracer, overruns)
+        if power_policy:
+            power_policy.attach(self)
 
         self.set_direction()
-        self.ramp_down = False
-        
-        self.freq_hi = steps_per_rev * rpm_hi / 60  # Hz
-        self.freq_lo = steps_per_rev * rpm_lo / 60  # Hz
-        self.period_hi = int(1e6 / self.freq_hi) # half period time in us for freq_hi
-        self.period_lo = int(1e6 / self.freq_lo) # half period time in us for freq_lo
+        self.ramp_down = ramp_down
+        self.min_const_steps = min_const_steps
+        self.player = None # created by the first run_profile
+
+        self.freq_hi = rpm_to_freq_q(rpm_hi, steps_per_rev)  # 1/1024 Hz
+        self.freq_lo = rpm_to_freq_q(rpm_lo, steps_per_rev)  # 1/1024 Hz
+        self.period_hi = freq_to_period_us(self.freq_hi) # period time in us for freq_hi
+        self.period_lo = freq_to_period_us(self.freq_lo) # period time in us for freq_lo
         self.steps_per_rev = steps_per_rev
-        
+
 #         self.ramp_correction_factor_hi = 1.2 # for 1500 rpm with 800 steps per revolution
 #         self.ramp_correction_factor_lo = 1.06 # for 600 rpm with 800 steps per revolution
-        self.ramp_correction_factor = 1.00 # values of ramp correction are calculated wrongly without this factor
-        self.ramp_up = self.calc_ramp(self.freq_lo, self.freq_hi, ramp_up_time)
+        self.ramp_correction_factor = calibration.get("ramp_correction_factor", 1.00) # values of ramp correction are calculated wrongly without this factor
+        self.set_ramp_times(ramp_up_time, ramp_dn_time)
+        if stall_detector:
+            stall_detector.attach(self)
+
+    def set_ramp_times(self, ramp_up_time, ramp_dn_time, budget_us = None):
+        """
+        Calculates (or loads) the ramps for new ramp times in ms, longer times mean lower acceleration.
+        With jerk and budget_us the S-curves are generated in chunks of budget_us by prepare() instead,
+        the current ramps stay in use until both are complete.
+        """
+        if budget_us is not None and self.jerk:
+            up, up_key = self.scurve(self.freq_lo, self.freq_hi, ramp_up_time)
+            dn = dn_key = None
+            if self.ramp_down:
+                dn, dn_key = self.scurve(self.freq_hi, self.freq_lo, ramp_dn_time)
+            self.pending = (up, up_key, dn, dn_key, ramp_up_time, ramp_dn_time, budget_us) # one assignment, prepare() may run on the other core
+            self.requests += 1 # after the request, so prepare() never sees the count without it
+            return
+        self.ramp_up_time = ramp_up_time
+        self.ramp_dn_time = ramp_dn_time
+        self.ramp_up = self.get_ramp(self.freq_lo, self.freq_hi, ramp_up_time)
         if self.ramp_down:
-            self.ramp_dn = self.calc_ramp(self.freq_hi, self.freq_lo, ramp_dn_time)
+            self.ramp_dn = self.get_ramp(self.freq_hi, self.freq_lo, ramp_dn_time)
         else:
             self.ramp_dn = None
-    
+
+    def prepare(self):
+        """
+        Continues the S-curves of set_ramp_times for one time budget, call it between the chunks of the feeder.
+
+        Each core only writes its own counter, so a request of set_ramp_times during the generation
+        is never lost: the newest request is always the one generated and the older is dropped.
+
+        Returns:
+        True if the ramps of the last request are in use
+        """
+        requests = self.requests # before pending, which is then at least as new
+        if requests == self.prepared:
+            return True
+        pending = self.pending
+        up, up_key, dn, dn_key, ramp_up_time, ramp_dn_time, budget_us = pending
+        if not up.done:
+            up.run(budget_us)
+            return False
+        if dn and not dn.done:
+            dn.run(budget_us)
+            return False
+        if up_key is not None: # like get_ramp, the next start loads them
+            self.cache.save_ramp(up_key, up.periods)
+        if dn_key is not None:
+            self.cache.save_ramp(dn_key, dn.periods)
+        self.ramp_up_time = ramp_up_time
+        self.ramp_dn_time = ramp_dn_time
+        self.ramp_up = up.periods
+        self.ramp_dn = dn.periods if dn else None
+        self.prepared = requests
+        return requests == self.requests
+
+    def scurve(self, freq_start, freq_end, ramp_time):
+        """
+        Returns (SCurveRamp, key) for prepare(): the ramp is already complete if the cache holds it,
+        otherwise key is its cache key for storing it when it is complete (None without cache).
+        """
+        from SCurve import SCurveRamp
+        ramp = SCurveRamp(freq_start, freq_end, self.ramp_accel(freq_start, freq_end, ramp_time), self.jerk)
+        if not self.cache:
+            return ramp, None
+        key = self.cache.scurve_ramp_key(freq_start, freq_end, ramp_time, self.jerk)
+        periods = self.cache.load_ramp(key)
+        if periods is None:
+            return ramp, key
+        ramp.periods = periods
+        ramp.done = True
+        return ramp, None
+
+    def ramp_accel(self, freq_start, freq_end, ramp_time):
+        """
+        Returns the acceleration in Hz/s of the linear ramp (calc_ramp) from freq_start to freq_end (in 1/1024 Hz)
+        for ramp_time (in ms) on the step generators: its table assumes two period times per step, so with one
+        step per period time it lasts ramp_time / 2.
+        """
+        return (abs(freq_end - freq_start) >> FREQ_SHIFT) * 2000 // ramp_time
+
     def power_on(self):
-        """Power on stepper."""
+        """Power on stepper, not after fault()."""
+        if self.backend.faulted:
+            return
         self.slp.value(1)
 
     def power_off(self):
         """Power off stepper."""
         self.slp.value(0)
-    
+
+    def fault(self):
+        """Safe stop: step generator halted and driver asleep, latched until the Pico is reset."""
+        self.backend.fault()
+        self.power_off()
+
     def set_direction(self, right = True):
         self.turn_right = right
         self.dir.value(0 if right == True else 1)
 
+    def set_resolution(self, microsteps):
+        """Selects the microsteps per full step (1, 2, 4 or 8) at the driver."""
+        ms1, ms2 = MICROSTEP_PINS[microsteps]
+        self.ms_pins[0].value(ms1)
+        self.ms_pins[1].value(ms2)
+
+    def set_step_ratio(self, ratio):
+        """
+        Starts a segment of ratio microsteps per pulse. The microsteps of the segment before are
+        added up from the counter, so the StallDetector weights every pulse with the ratio of its
+        own segment, however many segments lie between two of its ticks.
+        """
+        counted = self.backend.counted()
+        if counted is not None:
+            start, microsteps, before = self.segment
+            self.segment = (counted, microsteps + ((counted - start) & 0xffffffff) * before, ratio) # one assignment, tick() reads it on core 0
+
     def do_revolutions(self, revolutions):
         """Rotate stepper motor for the given number of revolutions"""
+        return self.do_steps(self.revolutions_to_steps(revolutions))
+
+    def do_steps(self, steps):
+        """Rotate stepper motor for the given number of steps, negative for left turns"""
         number_of_performed_steps = 0
         performed_steps_up = 0
         performed_steps_const = 0
         performed_steps_dn = 0
-        
-        self.set_direction(True if revolutions >= 0 else False)
-        
-        steps = abs(self.revolutions_to_steps(revolutions))
+        backend = self.backend
+        power = self.power_policy
+        if power and steps != 0:
+            power.wake() # settles while the move is planned
+
+        self.set_direction(True if steps >= 0 else False)
+
+        steps = abs(steps)
         if self.ramp_dn:
             steps_without_ramp = steps - len(self.ramp_up) - len(self.ramp_dn)
         else:
             steps_without_ramp = steps - len(self.ramp_up)
-        
-        if steps != 0:            
-            if steps_without_ramp > 0: # enough steps for higher speed and ramps
-                performed_steps_up = self.execute_ramp(self.ramp_up)
-                performed_steps_const = self.execute_steps(steps_without_ramp, self.period_hi)
-                if self.ramp_dn:
-                    performed_steps_dn = self.execute_ramp(self.ramp_dn)
+
+        trace = self.tracer
+        if steps != 0:
+            if trace: trace.event(EV_MOVE_BEGIN, steps)
+            counted_before = backend.counted() if self.metrics else None
+            self.coarse_extra = 0
+            if power: power.before_move()
+            if steps_without_ramp > self.min_const_steps: # enough steps for higher speed and ramps
+                if trace: trace.event(EV_RAMP_BEGIN)
+                performed_steps_up = backend.execute_ramp(self.ramp_up)
+                if trace: trace.event(EV_RAMP_END, performed_steps_up)
+                if performed_steps_up == len(self.ramp_up):
+                    if trace: trace.event(EV_STEPS_BEGIN)
+                    position = self.position + (performed_steps_up if self.turn_right else -performed_steps_up)
+                    performed_steps_const = self.execute_cruise(steps_without_ramp, self.period_hi, position)
+                    if trace: trace.event(EV_STEPS_END, performed_steps_const)
+                    if self.ramp_dn and performed_steps_const == steps_without_ramp:
+                        if trace: trace.event(EV_RAMP_BEGIN)
+                        performed_steps_dn = backend.execute_ramp(self.ramp_dn)
+                        if trace: trace.event(EV_RAMP_END, performed_steps_dn)
+            elif self.jerk: # not enough steps for both S-curves: shortened ramps with a lower peak speed
+                if trace: trace.event(EV_RAMP_BEGIN)
+                performed_steps_up, performed_steps_const, performed_steps_dn = self.execute_short(steps)
+                if trace: trace.event(EV_RAMP_END, performed_steps_up + performed_steps_const + performed_steps_dn)
             else: # not enough steps for higher speed and ramps
-                performed_steps_const = self.execute_steps(steps, self.period_lo)
+                if trace: trace.event(EV_STEPS_BEGIN)
+                performed_steps_const = backend.execute_steps(steps, self.period_lo)
+                if trace: trace.event(EV_STEPS_END, performed_steps_const)
             number_of_performed_steps = (performed_steps_up + performed_steps_const + performed_steps_dn) * (1 if self.turn_right else -1)
+            self.position += number_of_performed_steps
+            backend.halt()
+            if power: power.after_move()
+            if trace: trace.event(EV_MOVE_END, abs(number_of_performed_steps))
+            if self.metrics:
+                self.m_steps_commanded.inc(steps)
+                self.m_steps_performed.inc(abs(number_of_performed_steps))
+                if counted_before is not None: # pulses of the coarse cruise count ratio microsteps, like performed
+                    self.m_steps_counted.inc(((backend.counted() - counted_before) & 0xffffffff) + self.coarse_extra)
+                    self.m_counter_drift.set(self.m_steps_counted.value - self.m_steps_performed.value)
         return number_of_performed_steps
-    
+
+    def short_ramps(self, steps):
+        """
+        Splits a move which is too short for both ramps like ProfileCompiler._scurve: the highest peak
+        speed whose ramps fit is searched by bisection of the peak period, integer only.
+
+        Returns:
+        (n_up, n_dn, period): the first n_up steps of ramp_up, steps - n_up - n_dn steps with period
+        and the last n_dn steps of ramp_dn
+        """
+        up = self.ramp_up
+        dn = self.ramp_dn
+        fast = up[len(up) - 1] if len(up) else self.period_hi
+        slow = self.period_lo
+        while fast < slow:
+            mid = (fast + slow) >> 1
+            if ramp_steps_up(up, mid) + ramp_steps_dn(dn, mid) <= steps:
+                slow = mid
+            else:
+                fast = mid + 1
+        n_up = min(ramp_steps_up(up, slow), steps)
+        n_dn = min(ramp_steps_dn(dn, slow), steps - n_up)
+        return n_up, n_dn, slow
+
+    def execute_short(self, steps):
+        """
+        Runs a move which is too short for both ramps, see short_ramps.
+
+        Returns:
+        The performed steps of (ramp up, constant speed, ramp down)
+        """
+        backend = self.backend
+        n_up, n_dn, period = self.short_ramps(steps)
+        n_const = steps - n_up - n_dn
+        up = backend.execute_ramp(memoryview(self.ramp_up)[:n_up]) if n_up else 0
+        if up < n_up:
+            return up, 0, 0
+        const = backend.execute_steps(n_const, period) if n_const else 0
+        if const < n_const:
+            return up, const, 0
+        dn = backend.execute_ramp(memoryview(self.ramp_dn)[len(self.ramp_dn) - n_dn:]) if n_dn else 0
+        return up, const, dn
+
+    def execute_cruise(self, steps, period_time, position):
+        """
+        Runs steps with a constant period time starting at position (both in microsteps). Between
+        the first and the last full step boundary the driver runs at cruise_microsteps with the
+        period time scaled up, so the step generator emits fewer pulses at the same speed. The
+        resolution only changes at full step boundaries, where every resolution has a valid position,
+        and only with a backend of exact_steps, so MS1/MS2 never change during a pulse.
+
+        Returns:
+        The number of performed steps, in microsteps
+        """
+        backend = self.backend
+        fine = self.microsteps
+        coarse = self.cruise_microsteps
+        if not coarse or coarse >= fine:
+            return backend.execute_steps(steps, period_time)
+        ratio = fine // coarse
+        align = (-position if self.turn_right else position) % fine # microsteps to the next full step
+        coarse_steps = (steps - align) // fine * coarse
+        if coarse_steps <= 0:
+            return backend.execute_steps(steps, period_time)
+        performed = backend.execute_steps(align, period_time) if align else 0
+        if performed < align:
+            return performed
+        self.set_resolution(coarse)
+        self.set_step_ratio(ratio)
+        performed_coarse = backend.execute_steps(coarse_steps, period_time * ratio)
+        self.set_resolution(fine)
+        self.set_step_ratio(1)
+        performed += performed_coarse * ratio
+        self.coarse_extra = performed_coarse * (ratio - 1)
+        rest = steps - align - coarse_steps * ratio
+        if performed_coarse == coarse_steps and rest:
+            performed += backend.execute_steps(rest, period_time)
+        return performed
+
+    def run_profile(self, stream, on_sync = None):
+        """
+        Executes a command stream compiled by ProfileCompiler, given as bytearray or as path of a file.
+
+        Returns:
+        The number of performed steps, negative for left turns
+        """
+        if self.player is None:
+            from ProfileCompiler import ProfilePlayer
+            self.player = ProfilePlayer(self.backend, self.set_direction) # turn_right follows the DIR commands
+        self.player.on_sync = on_sync
+        power = self.power_policy
+        if power: power.before_move()
+        if isinstance(stream, str):
+            performed = self.player.play_file(stream)
+        else:
+            performed = self.player.play(stream)
+        if power: power.after_move()
+        self.position += performed
+        return performed
+
     def revolutions_to_steps(self, revolutions):
         return int(self.steps_per_rev * revolutions)
-    
+
     def steps_to_revolutions(self, steps):
         return steps / self.steps_per_rev
-    
+
+    def get_ramp(self, freq_start, freq_end, ramp_time):
+        """
+        Returns the ramp from freq_start to freq_end (in 1/1024 Hz) within the ramp_time (in ms)
+        as array of period times, loaded from the cache if possible, otherwise calculated
+        (and stored in the cache).
+        """
+        if not self.cache:
+            return array("I", self.calc_ramp(freq_start, freq_end, ramp_time))
+        if self.motor:
+            key = self.cache.torque_ramp_key(freq_start, freq_end, self.steps_per_rev, self.motor)
+        elif self.jerk:
+            key = self.cache.scurve_ramp_key(freq_start, freq_end, ramp_time, self.jerk)
+        else:
+            key = self.cache.ramp_key(freq_start, freq_end, ramp_time, self.ramp_correction_factor)
+        ramp = self.cache.load_ramp(key)
+        if ramp is None:
+            ramp = array("I", self.calc_ramp(freq_start, freq_end, ramp_time))
+            self.cache.save_ramp(key, ramp)
+        return ramp
+
     def calc_ramp(self, freq_start, freq_end, ramp_time):
         """
-        Calculates a ramp from freq_start (in Hz) to freq_end (in Hz) within the ramp_time (in ms).
-        
+        Calculates a ramp from freq_start to freq_end (in 1/1024 Hz) within the ramp_time (in ms)
+        with integer arithmetic only, see FixedPoint.calc_ramp. With a motor curve the ramp is
+        as fast as its torque allows instead, see TorqueRamp.MotorCurve.ramp. With a jerk limit
+        the ramp is an S-curve with the maximum acceleration of the linear ramp (see ramp_accel) and
+        one step per period time like the step generators, see SCurve.SCurveRamp.
+
         Returns:
         A list of integers of period times (in us) from freq_start to freq_end
         """
-        
-        t_ramp = ramp_time * 1000
-        m = (freq_end - freq_start) / t_ramp
-        b = freq_start
-        x = 0
-        correction = self.ramp_correction_factor
-        period_times = []
-        
-        while x < t_ramp:
-            # calculating half period time in us
-            y = 1e6 / (m * x + b) * correction
-            period_times.append(int(y))
-            x += 2 * y 
-        return period_times
-    
-    def execute_ramp(self, period_times):
-        """
-        Executes a ramp with a list of period times from freq_start to freq_end
-        """
-        times_list = period_times
-        for index, period_time in enumerate(times_list):
-            before_if = ticks_us()
-            if self.stop.value() == 0 or self.stop.value() == 0 or self.stop.value() == 0:
-                return index # number of performed steps
-            after_if = ticks_us()
-            self.stp.value(1)
-            sleep_us(1)
-            self.stp.value(0)
-            sleep_us(period_time + before_if - after_if - 1)
-#             sleep_us(period_time - 1)
-        return len(period_times)
-    
-    def execute_steps(self, steps, period_time):
-        for i in range(steps):
-            before_if = ticks_us()
-            if self.stop.value() == 0 or self.stop.value() == 0 or self.stop.value() == 0:
-                return i
-            after_if = ticks_us()
-            self.stp.value(1)
-            sleep_us(1)
-            self.stp.value(0)
-            sleep_us(period_time + before_if - after_if - 1)
-        return steps
-        
-        
+        if self.motor:
+            return self.motor.ramp(freq_start, freq_end, self.steps_per_rev)
+        if self.jerk:
+            from SCurve import calc_scurve
+            return calc_scurve(freq_start, freq_end, self.ramp_accel(freq_start, freq_end, ramp_time), self.jerk)
+        return calc_ramp(freq_start, freq_end, ramp_time, to_q(self.ramp_correction_factor, CORRECTION_SHIFT))
+
+
+def ramp_steps_up(periods, period):
+    """Returns the number of steps at the start of an acceleration ramp (falling periods) which are not faster than period."""
+    lo = 0
+    hi = len(periods)
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if periods[mid] >= period:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def ramp_steps_dn(periods, period):
+    """Returns the number of steps at the end of a deceleration ramp (rising periods, None for none) which are not faster than period."""
+    if not periods:
+        return 0
+    lo = 0
+    hi = len(periods)
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if periods[mid] >= period:
+            hi = mid
+        else:
+            lo = mid + 1
+    return len(periods) - lo
+
+
+def benchmark(stepper, moves):
+    """
+    Runs the same move sequence (list of steps) on a stepper.
+
+    Returns:
+    (performed steps, duration in us), the duration is the virtual time for the SimulatedBackend
+    """
+    backend = stepper.backend
+    if backend.name == "simulated":
+        start = backend.time_us
+        performed = sum([abs(stepper.do_steps(steps)) for steps in moves])
+        return performed, backend.time_us - start
+    from Compat import ticks_us, ticks_diff
+    start = ticks_us()
+    performed = sum([abs(stepper.do_steps(steps)) for steps in moves])
+    return performed, ticks_diff(ticks_us(), start)
+
+
 if __name__ == "__main__":
+    from machine import Pin
+    from StepperBackends import SoftwareBackend, PIOStreamBackend, PIOCountBackend
     stepper_pul = Pin(2)
     stepper_dir = Pin(3)
     stepper_en = Pin(4)
-    # def __init__(self, step_pin, dir_pin, sleep_pin, rpm_hi, rpm_lo, ramp_up_time, ramp_dn_time, steps_per_rev)
-    m1 = Stepper(stepper_pul, stepper_dir, stepper_en, 600, 50, 1200, 400, 800)
-    for i in range(1):
-#         m1.ramp_up = m1.calc_ramp(m1.freq_lo, m1.freq_hi, 1000)
-        m1.do_revolutions(10)
-        sleep_ms(200)
-        m1.do_revolutions(-10)
-        sleep_ms(200)
-#     m1.do_revolutions(100)
\ No newline at end of file
+    moves = [8000, -8000, 400, -400]
+    for backend_class in (SoftwareBackend, PIOStreamBackend, PIOCountBackend):
+        backend = backend_class(stepper_pul)
+        # def __init__(self, step_pin, dir_pin, sleep_pin, rpm_hi, rpm_lo, ramp_up_time, ramp_dn_time, steps_per_rev, backend)
+        m1 = Stepper(stepper_pul, stepper_dir, stepper_en, 600, 50, 1200, 400, 800, backend)
+        m1.power_on()
+        print(backend.name, benchmark(m1, moves))
+        m1.power_off()
+        backend.close()
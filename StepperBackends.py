@@ -0,0 +1,330 @@
+"""
+Pulse backends for the Stepper.
+
+A backend generates the step pulses, the Stepper only plans the moves:
+
+    attach(stop, stop_mask, ...)        called once by the Stepper
+    execute_ramp(period_times) -> int   steps with the given period times (array or list, in us)
+    execute_steps(steps, period) -> int steps with a constant period time (in us)
+    halt()                              after a move or a stream of moves
+    fault()                             safe stop, latched: no more pulses until the reset
+    close()                             releases the state machines
+    counted() -> int or None            cumulated count of emitted steps, if the backend can measure it
+    exact_steps: bool                   the pulses have ended when an execute function returns
+
+Both execute functions stop early if the stop pin is low and return the number of
+performed steps, after fault() they emit nothing. The hardware modules are imported by the backends themselves, so
+the Stepper with the SimulatedBackend also runs on the host.
+"""
+from Tracer import EV_STEP, EV_STOP
+from Compat import sleep_us, ticks_us
+
+
+class Backend:
+    """Common part of the backends."""
+
+    name = "backend"
+    exact_steps = False
+    faulted = False
+
+    def attach(self, stop, stop_mask = 0, tracer = None, overruns = None):
+        """
+        stop: machine.Pin, pulled low for stopping
+        stop_mask: int, 1 << number of the stop pin, for the viper loops
+        tracer: Tracer, records single steps in the portable loops
+        overruns: Metrics.Counter, counts periods which were over before the stop check was done
+        """
+        self.stop = stop
+        self.stop_mask = stop_mask
+        self.tracer = tracer
+        self.overruns = overruns
+
+    def stopped(self):
+        stop = self.stop
+        return stop.value() == 0 or stop.value() == 0 or stop.value() == 0
+
+    def halt(self):
+        pass
+
+    def fault(self):
+        """Halts the pulses for good, the execute functions return 0 until the Pico is reset."""
+        self.faulted = True
+        self.halt()
+
+    def close(self):
+        pass
+
+    def counted(self):
+        return None
+
+
+class SoftwareBackend(Backend):
+    """Bit-banged pulses of 1 us, paced with sleep_us (former Stepper.py)."""
+
+    name = "software"
+    exact_steps = True
+
+    def __init__(self, step_pin):
+        self.stp = step_pin
+        self.stp.init(self.stp.OUT)
+
+    def execute_ramp(self, period_times):
+        if self.faulted:
+            return 0
+        trace = self.tracer
+        for index in range(len(period_times)):
+            period_time = period_times[index]
+            before_if = ticks_us()
+            if trace: trace.event(EV_STEP, index)
+            if self.stopped():
+                if trace: trace.event(EV_STOP, index)
+                return index # number of performed steps
+            after_if = ticks_us()
+            self.stp.value(1)
+            sleep_us(1)
+            self.stp.value(0)
+            wait = period_time + before_if - after_if - 1
+            if wait <= 0 and self.overruns: self.overruns.inc()
+            sleep_us(wait)
+        return len(period_times)
+
+    def execute_steps(self, steps, period_time):
+        if self.faulted:
+            return 0
+        trace = self.tracer
+        for i in range(steps):
+            before_if = ticks_us()
+            if trace: trace.event(EV_STEP, i)
+            if self.stopped():
+                if trace: trace.event(EV_STOP, i)
+                return i
+            after_if = ticks_us()
+            self.stp.value(1)
+            sleep_us(1)
+            self.stp.value(0)
+            wait = period_time + before_if - after_if - 1
+            if wait <= 0 and self.overruns: self.overruns.inc()
+            sleep_us(wait)
+        return steps
+
+
+class PIOStreamBackend(Backend):
+    """
+    SMFrequency holds the period time until the next one is put, the loops put the
+    periods in time (former Stepper_v2.py / Stepper_v3.py). The PIO program keeps the
+    pin high and low for half the period time each, so one step lasts the period time.
+    Uses the viper loops of FastLoops if available and no tracer is attached. The step
+    generator runs on after the execute functions, so they end at no defined pulse.
+    """
+
+    name = "pio_stream"
+
+    def __init__(self, step_pin, smID = None, counter = True, counter_smID = None, fast_loops = True):
+        """
+        smID: int, state machine of the step generator, None for one chosen by PIOManager
+        counter: bool, count the steps with a SMCounter on the step pin
+        counter_smID: int, state machine of the SMCounter, None for one chosen by PIOManager
+        """
+        from SMFrequency import SMFrequency
+        from FastLoops import VIPER, txf_address
+        step_pin.init(step_pin.OUT)
+        self.sm_freq = SMFrequency(smID = smID, OutputPin = step_pin)
+        self.sm_counter = None
+        if counter:
+            from SMCounter import SMCounter
+            self.sm_counter = SMCounter(smID = counter_smID, InputPin = step_pin)
+        self.fast_loops = fast_loops and VIPER
+        self.txf = txf_address(self.sm_freq.claim.smID)
+
+    def execute_ramp(self, period_times):
+        if self.faulted:
+            return 0
+        trace = self.tracer
+        first_val = period_times[0]
+        self.sm_freq.set_period_us(first_val)
+        self.sm_freq.active(1)
+        if self.fast_loops and self.stop_mask and not trace:
+            from FastLoops import feed_ramp
+            return feed_ramp(self.txf, period_times, len(period_times), self.stop_mask)
+        sleep_us(first_val-1)
+        for index in range(1, len(period_times)):
+            period_time = period_times[index]
+            self.sm_freq.set_period_us(period_time)
+            before_if = ticks_us()
+            if trace: trace.event(EV_STEP, index)
+            if self.stopped():
+                if trace: trace.event(EV_STOP, index)
+                return index # number of performed steps
+            after_if = ticks_us()
+            wait = period_time + before_if - after_if
+            if wait <= 0 and self.overruns: self.overruns.inc()
+            sleep_us(wait)
+        return len(period_times)
+
+    def execute_steps(self, steps, period_time):
+        if self.faulted:
+            return 0
+        trace = self.tracer
+        self.sm_freq.set_period_us(period_time)
+        self.sm_freq.active(1)
+        if self.fast_loops and self.stop_mask and not trace:
+            from FastLoops import wait_steps
+            return wait_steps(steps, period_time, self.stop_mask)
+        sleep_us(period_time - 1)
+        for i in range(steps - 1):
+            before_if = ticks_us()
+            if trace: trace.event(EV_STEP, i + 1)
+            if self.stopped():
+                if trace: trace.event(EV_STOP, i + 1)
+                return i + 1
+            after_if = ticks_us()
+            wait = period_time + before_if - after_if
+            if wait <= 0 and self.overruns: self.overruns.inc()
+            sleep_us(wait)
+        return steps
+
+    def halt(self):
+        self.sm_freq.active(0)
+
+    def close(self):
+        """Releases the state machines."""
+        self.sm_freq.close()
+        if self.sm_counter:
+            self.sm_counter.close()
+
+    def counted(self):
+        return self.sm_counter.value() if self.sm_counter else None
+
+
+class PIOCountBackend(Backend):
+    """
+    SMSteps emits exactly the queued number of steps, one step per period time, and a
+    SMCounter on the step pin counts them. The CPU only refills the fifo and checks
+    the stop pin, so late checks do not change the pulse timing.
+    """
+
+    name = "pio_count"
+    exact_steps = True
+
+    def __init__(self, step_pin, smID = None, counter_smID = None):
+        from SMSteps import SMSteps
+        from SMCounter import SMCounter
+        step_pin.init(step_pin.OUT)
+        self.sm_steps = SMSteps(smID = smID, OutputPin = step_pin)
+        self.sm_counter = SMCounter(smID = counter_smID, InputPin = step_pin)
+
+    def execute_ramp(self, period_times):
+        if self.faulted:
+            return 0
+        start = self.sm_counter.value()
+        self.sm_steps.active(1)
+        trace = self.tracer
+        for index in range(len(period_times)):
+            if trace: trace.event(EV_STEP, index)
+            if self.stopped():
+                return self._abort(start)
+            self.sm_steps.put_steps(1, period_times[index]) # blocks while the fifo is full
+        return self._wait(start, len(period_times), period_times[len(period_times) - 1])
+
+    def execute_steps(self, steps, period_time):
+        if self.faulted:
+            return 0
+        start = self.sm_counter.value()
+        self.sm_steps.active(1)
+        self.sm_steps.put_steps(steps, period_time)
+        return self._wait(start, steps, period_time)
+
+    def _wait(self, start, steps, period_time):
+        poll_us = min(period_time, 1000)
+        while (self.sm_counter.value() - start) & 0xffffffff < steps:
+            if self.stopped():
+                return self._abort(start)
+            sleep_us(poll_us)
+        sleep_us(period_time) # low phase of the last step
+        return steps
+
+    def _abort(self, start):
+        self.sm_steps.restart()
+        if self.tracer: self.tracer.event(EV_STOP, 0)
+        return (self.sm_counter.value() - start) & 0xffffffff
+
+    def halt(self):
+        self.sm_steps.active(0)
+
+    def close(self):
+        """Releases the state machines."""
+        self.sm_steps.close()
+        self.sm_counter.close()
+
+    def counted(self):
+        return self.sm_counter.value()
+
+
+class SimPin:
+    """Stand-in for machine.Pin on the host."""
+
+    OUT = 1
+    IN = 0
+    PULL_UP = 1
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, value = 1):
+        self._value = value
+        self.handler = None
+
+    def init(self, mode = None, pull = None, value = None):
+        if value is not None:
+            self._value = value
+        elif pull == self.PULL_UP:
+            self._value = 1 # open input
+
+    def irq(self, handler = None, trigger = 0, hard = False):
+        self.handler = handler
+
+    def value(self, value = None):
+        if value is None:
+            return self._value
+        self._value = value
+
+
+class SimulatedBackend(Backend):
+    """
+    Emits no pulses but adds up the virtual time of the steps, for running and
+    benchmarking move sequences on the host.
+    """
+
+    name = "simulated"
+    exact_steps = True
+
+    def __init__(self, stop_after = None, record = False):
+        """
+        stop_after: int, simulate the stop pin after this number of steps
+        record: bool, keep every period time in self.periods
+        """
+        self.stop_after = stop_after
+        self.time_us = 0
+        self.steps = 0
+        self.periods = [] if record else None
+
+    def _run(self, periods, n):
+        if self.faulted or self.stopped():
+            return 0
+        if self.stop_after is not None and self.steps + n > self.stop_after:
+            n = max(self.stop_after - self.steps, 0)
+        for i in range(n):
+            period = periods(i)
+            self.time_us += period
+            if self.periods is not None:
+                self.periods.append(period)
+        self.steps += n
+        return n
+
+    def execute_ramp(self, period_times):
+        return self._run(lambda i: period_times[i], len(period_times))
+
+    def execute_steps(self, steps, period_time):
+        return self._run(lambda i: period_time, steps)
+
+    def counted(self):
+        return self.steps
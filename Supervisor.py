@@ -0,0 +1,160 @@
+"""
+Micropython module for supervising the tasks of the controller with the hardware watchdog.
+
+Every task reports its progress with report(task), which only writes a preallocated
+array, so it may be called from both cores. check() runs periodically on core 0 and
+feeds machine.WDT only if every task reported within its deadline. Otherwise the
+miss is counted and logged, the motor is stopped safely (step generator halted,
+driver asleep, latched until the reset) and the watchdog resets the Pico after its timeout.
+"""
+from array import array
+from Compat import ticks_ms, ticks_diff
+
+LOG_PATH = "supervisor.log"
+
+
+class Supervisor:
+    """Feeds the watchdog while all registered tasks make progress."""
+
+    def __init__(self, timeout_ms = 2000, watchdog = True, metrics = None, log_path = LOG_PATH):
+        """
+        Initialize supervisor
+
+        timeout_ms: int, watchdog timeout (at most 8388 ms on the RP2040)
+        watchdog: bool, start machine.WDT, it can not be stopped anymore
+        metrics: Metrics.Registry, receives the deadline misses per task and the watchdog resets
+        log_path: str, file for the faults, None for print only
+        """
+        self.names = []
+        self.deadlines = array("i")
+        self.last = array("i")
+        self.misses = array("i")
+        self.stops = []           # functions of the safe stop
+        self.failed = False       # a deadline was missed or a task failed, waiting for the reset
+        self.metrics = metrics
+        self.log_path = log_path
+        self.m_misses = []
+        self.wdt = None
+        if watchdog:
+            from machine import WDT, reset_cause, WDT_RESET
+            if reset_cause() == WDT_RESET:
+                self.log("reset by watchdog")
+                if metrics:
+                    metrics.counter("watchdog_resets").inc()
+            self.wdt = WDT(timeout = timeout_ms)
+
+    def task(self, name, deadline_ms):
+        """
+        Registers a task which has to report at least every deadline_ms.
+
+        Returns:
+        The id of the task for report()
+        """
+        self.names.append(name)
+        self.deadlines.append(deadline_ms)
+        self.last.append(ticks_ms())
+        self.misses.append(0)
+        self.m_misses.append(self.metrics.counter("deadline_misses_" + name) if self.metrics else None)
+        return len(self.names) - 1
+
+    def report(self, task):
+        """Progress of a task, allocation free."""
+        self.last[task] = ticks_ms()
+
+    def on_stop(self, function):
+        """Adds a function of the safe stop, e.g. halting the step generator."""
+        self.stops.append(function)
+
+    def guard_stepper(self, stepper):
+        """
+        Adds the safe stop of a Stepper: step generator halted and driver asleep. Both are latched
+        (Stepper.fault), so neither a later command of core 1 nor the PowerPolicy restarts the motor.
+        """
+        self.on_stop(stepper.fault)
+
+    def check(self):
+        """
+        Feeds the watchdog if every task is within its deadline, call it periodically.
+        After the first miss the motor is stopped and the watchdog is not fed anymore.
+
+        Returns:
+        True if the watchdog was fed
+        """
+        if self.failed:
+            return False
+        now = ticks_ms()
+        ok = True
+        for i in range(len(self.names)):
+            if ticks_diff(now, self.last[i]) > self.deadlines[i]:
+                ok = False
+                self.misses[i] += 1
+                if self.m_misses[i]:
+                    self.m_misses[i].inc()
+                self.log("deadline missed: %s" % self.names[i])
+        if not ok:
+            self.failed = True
+            self.safe_stop()
+            return False
+        if self.wdt:
+            self.wdt.feed()
+        return True
+
+    def fault(self, task, exception):
+        """An unhandled exception of a task: logs it, stops the motor and lets the watchdog reset."""
+        self.log("fault in %s: %r" % (self.names[task], exception))
+        self.failed = True
+        self.safe_stop()
+
+    def safe_stop(self):
+        for function in self.stops:
+            try:
+                function()
+            except Exception:
+                pass
+
+    def log(self, message):
+        line = "%d %s" % (ticks_ms(), message)
+        print(line)
+        if self.log_path:
+            try:
+                with open(self.log_path, "a") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+
+    def status(self):
+        """Returns a list of (name, ms since the last report, deadline, misses)."""
+        now = ticks_ms()
+        return [(self.names[i], ticks_diff(now, self.last[i]), self.deadlines[i], self.misses[i]) for i in range(len(self.names))]
+
+
+if __name__ == "__main__":
+    # on the host without watchdog: the second task stops reporting
+    from time import sleep
+    supervisor = Supervisor(watchdog = False, log_path = None)
+    supervisor.on_stop(lambda: print("safe stop"))
+    fast = supervisor.task("fast", 100)
+    slow = supervisor.task("slow", 300)
+    for i in range(10):
+        supervisor.report(fast)
+        if i < 4:
+            supervisor.report(slow)
+        print(i, supervisor.check())
+        sleep(0.1)
+    print(supervisor.status())
+
+    # a command after the safe stop emits no pulses and does not wake the driver
+    from Stepper import Stepper
+    from StepperBackends import SimulatedBackend, SimPin
+    from PowerPolicy import PowerPolicy
+    from MotionCore import MotionCore, ERRORS
+    m1 = Stepper(SimPin(), SimPin(), SimPin(), 600, 50, 1200, 400, 800, SimulatedBackend(), stop_pin = SimPin(), power_policy = PowerPolicy())
+    supervisor = Supervisor(watchdog = False, log_path = None)
+    motion = MotionCore(m1, supervisor = supervisor)
+    supervisor.safe_stop()
+    motion.move(8000)
+    motion.power(True)
+    motion.quit()
+    motion.run()
+    assert m1.backend.steps == 0 and m1.slp.value() == 0, "pulses after the safe stop"
+    print("after safe stop: %d steps, %d errors" % (m1.backend.steps, motion.status[ERRORS]))
@@ -0,0 +1,90 @@
+"""
+Micropython module for ramps limited by the torque of the motor instead of a fixed time.
+
+The pull-out torque of a stepper falls with the speed, a linear ramp has to be slow
+enough for the highest speed and wastes torque at low speed. Here the acceleration
+follows the torque curve: a = (margin * torque(rpm) - load_torque) / inertia, so the
+ramp is steep at low speed and tapers towards rpm_hi. The ramps are computed with
+floats once at start-up and cached by Stepper.get_ramp like the linear ramps.
+"""
+import struct
+from math import pi
+
+from FixedPoint import FREQ_SHIFT
+
+
+class MotorCurve:
+    """Pull-out torque vs. speed of a motor with its load."""
+
+    def __init__(self, points, inertia, margin = 0.7, load_torque = 0.0):
+        """
+        Initialize motor curve
+
+        points: list of (rpm, torque in Nm) sorted by rpm, from the data sheet of the motor and driver
+        inertia: float (kg m**2), rotor and load reflected to the motor shaft
+        margin: float, share of the pull-out torque used for accelerating
+        load_torque: float (Nm), friction or weight, opposes accelerating and helps braking
+        """
+        self.points = points
+        self.inertia = inertia
+        self.margin = margin
+        self.load_torque = load_torque
+
+    def torque(self, rpm):
+        """Returns the pull-out torque (Nm) at rpm, interpolated linearly, constant beyond the curve."""
+        points = self.points
+        if rpm <= points[0][0]:
+            return points[0][1]
+        for i in range(1, len(points)):
+            rpm1, torque1 = points[i]
+            if rpm <= rpm1:
+                rpm0, torque0 = points[i - 1]
+                return torque0 + (torque1 - torque0) * (rpm - rpm0) / (rpm1 - rpm0)
+        return points[-1][1]
+
+    def accel(self, rpm, braking = False):
+        """Returns the allowed acceleration in revolutions/s**2 at rpm."""
+        load = -self.load_torque if braking else self.load_torque
+        return (self.margin * self.torque(rpm) - load) / self.inertia / (2 * pi)
+
+    def key(self):
+        """Returns the parameters packed into bytes, for the key of a cached ramp."""
+        data = struct.pack("<ddd", self.inertia, self.margin, self.load_torque)
+        for rpm, torque in self.points:
+            data += struct.pack("<dd", rpm, torque)
+        return data
+
+    def ramp(self, freq_start_q, freq_end_q, steps_per_rev):
+        """
+        Calculates the fastest ramp from freq_start_q to freq_end_q (in 1/1024 Hz) within the torque
+        limit. Every step changes the frequency by a / f (a in steps/s**2), like FixedPoint.calc_ramp.
+        A deceleration ramp is calculated upwards with the braking acceleration and reversed.
+
+        Returns:
+        A list of integers of period times (in us) from freq_start to freq_end
+        """
+        braking = freq_end_q < freq_start_q
+        f = min(freq_start_q, freq_end_q) / (1 << FREQ_SHIFT)
+        f_end = max(freq_start_q, freq_end_q) / (1 << FREQ_SHIFT)
+        period_times = []
+        while f < f_end:
+            period_times.append(int(1e6 / f))
+            rpm = f * 60 / steps_per_rev
+            a = self.accel(rpm, braking) * steps_per_rev
+            if a <= 0:
+                raise ValueError("motor torque too low above %d rpm" % rpm)
+            f += a / f
+        if braking:
+            period_times.reverse()
+        return period_times
+
+
+if __name__ == "__main__":
+    # torque ramp versus a linear ramp which stays within the torque at 600 rpm, 800 steps per revolution, 50 -> 600 rpm
+    from FixedPoint import rpm_to_freq_q
+    motor = MotorCurve([(0, 0.45), (300, 0.40), (600, 0.30), (900, 0.20), (1500, 0.10)], inertia = 2e-4, load_torque = 0.05)
+    f_lo = rpm_to_freq_q(50, 800)
+    f_hi = rpm_to_freq_q(600, 800)
+    for name, ramp, braking in [("up", motor.ramp(f_lo, f_hi, 800), False), ("dn", motor.ramp(f_hi, f_lo, 800), True)]:
+        linear = (f_hi - f_lo) / (1 << FREQ_SHIFT) / (motor.accel(600, braking) * 800) * 1000
+        print("%s: torque ramp %d steps in %d ms, linear ramp %d ms" % (name, len(ramp), sum(ramp) // 1000, linear))
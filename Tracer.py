@@ -0,0 +1,81 @@
+"""
+Micropython module for tracing events with timestamps into a preallocated ring buffer.
+
+Every event costs two array writes and a ticks_us() call, so the hooks can stay
+enabled in the step loops. Use one Tracer per core, the ring buffer is not
+shared safely between threads. Read the dumps on the host with trace_decode.py.
+"""
+import struct
+from array import array
+from Compat import ticks_us
+
+# event ids, *_BEGIN and *_END (BEGIN + 1) enclose a section which is reported in the time budget
+EV_MOVE_BEGIN = 1
+EV_MOVE_END = 2
+EV_RAMP_BEGIN = 3
+EV_RAMP_END = 4
+EV_STEPS_BEGIN = 5
+EV_STEPS_END = 6
+EV_LCD_BEGIN = 7
+EV_LCD_END = 8
+EV_STEP = 16            # arg: index of the step
+EV_STOP = 17            # arg: index of the step
+EV_ENCODER_CLICK = 18   # arg: new counter value
+EV_ENCODER_POLL = 19
+EV_DISPLAY_UPDATE = 20  # arg: displayed value
+EV_USER = 64            # first id for application events
+
+EVENT_NAMES = {
+    EV_MOVE_BEGIN: "move", EV_MOVE_END: "move",
+    EV_RAMP_BEGIN: "ramp", EV_RAMP_END: "ramp",
+    EV_STEPS_BEGIN: "steps", EV_STEPS_END: "steps",
+    EV_LCD_BEGIN: "lcd", EV_LCD_END: "lcd",
+    EV_STEP: "step", EV_STOP: "stop",
+    EV_ENCODER_CLICK: "encoder_click", EV_ENCODER_POLL: "encoder_poll",
+    EV_DISPLAY_UPDATE: "display_update",
+}
+
+MAGIC = b"ATR2"
+HEADER = "<4sBxHII" # magic, source, size, number of recorded events, ticks_us() of the dump
+
+
+class Tracer:
+    """Ring buffer of (ticks_us, event << 24 | arg) records."""
+
+    def __init__(self, size = 1024, source = 0):
+        """
+        Initialize tracer
+
+        size: int, number of records, must be a power of two
+        source: int, id of the core or task, stored in the dump
+        """
+        self.size = size
+        self.mask = size - 1
+        self.source = source
+        self.ts = array("I", [0] * size)
+        self.ev = array("I", [0] * size)
+        self.count = 0
+        self.enabled = True
+
+    def event(self, event, arg = 0):
+        if self.enabled:
+            i = self.count & self.mask
+            self.ts[i] = ticks_us()
+            self.ev[i] = (event << 24) | (arg & 0xffffff)
+            self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def dump(self, path):
+        """Writes the records in chronological order to a file."""
+        with open(path, "wb") as f:
+            self.write(f)
+
+    def write(self, stream):
+        n = min(self.count, self.size)
+        start = (self.count - n) & self.mask
+        stream.write(struct.pack(HEADER, MAGIC, self.source, 0, n, ticks_us())) # the common reference of the dumps
+        for i in range(n):
+            j = (start + i) & self.mask
+            stream.write(struct.pack("<II", self.ts[j], self.ev[j]))
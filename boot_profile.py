@@ -0,0 +1,62 @@
+"""
+Micropython module for measuring the import cost of the controller modules at boot.
+
+Usage (REPL or boot.py, before anything else is imported):
+
+    import boot_profile
+    boot_profile.report(boot_profile.profile_imports())
+
+Every module is imported in turn with its time and the allocated memory, the
+dependencies count for the first module which imports them. The column "from"
+shows whether a module was frozen into the firmware (see manifest.py), loaded
+as .mpy or compiled from the .py source.
+"""
+import sys
+import gc
+from Compat import ticks_us, ticks_diff
+
+# modules of the controller in the order of their dependencies, the modules of manifest.py
+# without the diagnostics (SMCapture and this module)
+HOT_MODULES = ["Compat", "FastLoops", "FixedPoint", "Tracer", "Metrics", "PIOManager", "SMFrequency", "SMCounter", "SMSteps",
+               "StepperBackends", "Stepper", "ProfileCompiler", "RampCache", "TorqueRamp", "SCurve", "PowerPolicy",
+               "StallDetector", "MotionCore", "Jog", "Recorder", "IrqEncoder", "Supervisor", "I2cBus", "lcd_pico"]
+
+
+def origin(module):
+    path = getattr(module, "__file__", "")
+    if path.startswith(".frozen") or not path:
+        return "frozen"
+    return "mpy" if path.endswith(".mpy") else "py"
+
+def profile_imports(modules = HOT_MODULES):
+    """
+    Returns:
+    A list of (name, time in us, allocated bytes, from or error)
+    """
+    results = []
+    for name in modules:
+        if name in sys.modules:
+            results.append((name, 0, 0, "loaded"))
+            continue
+        gc.collect()
+        before = gc.mem_alloc() if hasattr(gc, "mem_alloc") else 0
+        start = ticks_us()
+        try:
+            __import__(name)
+            status = origin(sys.modules[name])
+        except ImportError as e: # e.g. machine on the host
+            status = "error: %s" % e
+        duration = ticks_diff(ticks_us(), start)
+        allocated = (gc.mem_alloc() if hasattr(gc, "mem_alloc") else 0) - before
+        results.append((name, duration, allocated, status))
+    return results
+
+def report(results):
+    print("%-16s %10s %10s  %s" % ("module", "us", "bytes", "from"))
+    for name, duration, allocated, status in sorted(results, key = lambda r: -r[1]):
+        print("%-16s %10d %10d  %s" % (name, duration, allocated, status))
+    print("%-16s %10d %10d" % ("total", sum([r[1] for r in results]), sum([r[2] for r in results])))
+
+
+if __name__ == "__main__":
+    report(profile_imports())
@@ -4,7 +4,6 @@
 # Tested on RaspberryPi Pico"
 
 import time
-from time import sleep
 
 class LcdApi:
     """Implements the API for talking with HD44780 compatible character LCDs.
@@ -64,6 +63,9 @@ class LcdApi:
         self.cursor_y = 0
         self.implied_newline = False
         self.backlight = True
+        # copy of the display contents, for sending only changed characters
+        self.shadow = bytearray(b" " * (self.num_lines * self.num_columns))
+        self.custom_chars = [None] * 8
         self.display_off()
         self.backlight_on()
         self.clear()
@@ -79,6 +81,9 @@ class LcdApi:
         self.hal_write_command(self.LCD_HOME)
         self.cursor_x = 0
         self.cursor_y = 0
+        shadow = self.shadow
+        for i in range(len(shadow)):
+            shadow[i] = 0x20
 
     def show_cursor(self):
         """Causes the cursor to be made visible."""
@@ -188,6 +193,8 @@ class LcdApi:
             else:
                 self.cursor_x = self.num_columns
         else:
+            if self.cursor_y < self.num_lines and self.cursor_x < self.num_columns:
+                self.shadow[self.cursor_y * self.num_columns + self.cursor_x] = ord(char)
             self.hal_write_data(ord(char))
             self.cursor_x += 1
         if self.cursor_x >= self.num_columns:
@@ -201,6 +208,8 @@ class LcdApi:
     def putchar_no_move(self,char):
         """Writes a character to LCD but does not move the cursor"""
         # no change in cursor_x or cursor_y is required.
+        if self.cursor_y < self.num_lines and self.cursor_x < self.num_columns:
+            self.shadow[self.cursor_y * self.num_columns + self.cursor_x] = ord(char)
         self.hal_write_data(ord(char))
         self.move_cursor_left()
 
@@ -211,11 +220,38 @@ class LcdApi:
         for char in string:
             self.putchar(char)
 
+    def update_row(self, cursor_y, row):
+        """Writes a row buffer (bytearray of num_columns characters, e.g. filled
+        by format_number) to the line cursor_y. Only the characters which differ
+        from the displayed ones are sent, the cursor is only moved to skip
+        unchanged ones. Does not allocate memory.
+
+        Returns the number of sent characters.
+        """
+        shadow = self.shadow
+        base = cursor_y * self.num_columns
+        sent = 0
+        position = -1 # column the display writes next, -1 = unknown
+        for x in range(min(len(row), self.num_columns)):
+            char = row[x]
+            if shadow[base + x] != char:
+                if position != x:
+                    self.move_to(x, cursor_y)
+                self.hal_write_data(char)
+                shadow[base + x] = char
+                position = x + 1
+                sent += 1
+        if sent:
+            self.cursor_x = position
+            self.cursor_y = cursor_y
+        return sent
+
     def custom_char(self, location, charmap):
         """Write a character to one of the 8 CGRAM locations, available
         as chr(0) through chr(7).
         """
         location &= 0x7
+        self.custom_chars[location] = charmap
         self.hal_write_command(self.LCD_CGRAM | (location << 3))
         self.hal_sleep_us(40)
         for i in range(8):
@@ -258,9 +294,60 @@ class LcdApi:
         time.sleep_us(usecs)
 
 
+def format_number(buf, value, start = 0, width = None, decimals = 0, right = True, sign = False, unit = b""):
+    """Renders the integer value into the bytearray buf at start without
+    allocating memory. The field of width characters (default: up to the end
+    of buf) is padded with spaces, a number which does not fit is shown as #.
+
+    decimals: value is fixed point, e.g. 1234 with decimals = 2 is 12.34
+    right: right aligned, otherwise left aligned
+    sign: show + for positive values
+    unit: bytes appended to the number, e.g. b" mm"
+
+    Returns the index behind the field.
+    """
+    if width is None:
+        width = len(buf) - start
+    end = start + width
+    magnitude = -value if value < 0 else value
+    digits = 1
+    rest = magnitude // 10
+    while rest:
+        digits += 1
+        rest //= 10
+    if digits <= decimals:
+        digits = decimals + 1 # leading zero, e.g. 0.05
+    length = digits + (1 if decimals else 0) + (1 if value < 0 or sign else 0) + len(unit)
+    if length > width:
+        for i in range(start, end):
+            buf[i] = 0x23 # '#'
+        return end
+    first = end - length if right else start
+    for i in range(start, first):
+        buf[i] = 0x20
+    for i in range(first + length, end):
+        buf[i] = 0x20
+    p = first + length - len(unit)
+    for i in range(len(unit)):
+        buf[p + i] = unit[i]
+    for i in range(digits):
+        if decimals and i == decimals:
+            p -= 1
+            buf[p] = 0x2e # '.'
+        p -= 1
+        buf[p] = 0x30 + magnitude % 10
+        magnitude //= 10
+    if value < 0:
+        buf[p - 1] = 0x2d # '-'
+    elif sign:
+        buf[p - 1] = 0x2b # '+'
+    return end
+
+
 """Implements a HD44780 character LCD connected via PCF8574 on I2C.
     The PCF8574 has a jumper selectable address: 0x20 - 0x27 """
 DEFAULT_I2C_ADDR = 0x27
+POWERUP_MS = 20 # time after power on until the LCD accepts commands
 
 # Defines shifts or masks for the various LCD line attached to the PCF8574
 
@@ -271,23 +358,48 @@ SHIFT_BACKLIGHT = 3
 SHIFT_DATA = 4
 
 class I2cLcd(LcdApi):
-    """Implements a HD44780 character LCD connected via PCF8574 on I2C."""
-    def __init__(self, i2c, i2c_addr = DEFAULT_I2C_ADDR, num_lines = 2, num_columns = 16):
+    """Implements a HD44780 character LCD connected via PCF8574 on I2C.
+
+    i2c is a machine.I2C or an I2cBus shared with other devices. On a bus the
+    writes are queued and merged, the delays of the LCD only hold back the LCD.
+    Call flush() to wait until everything is sent.
+
+    The delays of the controller are deadlines instead of sleeps: a write only
+    waits for the rest of the delay before it, so the start-up work of the
+    caller overlaps with the initialisation (on a bus the constructor returns at
+    once). check() notices a lost display by the missing I2C ACK and restores
+    its contents from the shadow buffer when it answers again.
+    """
+    def __init__(self, i2c, i2c_addr = DEFAULT_I2C_ADDR, num_lines = 2, num_columns = 16, priority = 0):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
-        self.i2c.writeto(self.i2c_addr, bytearray([0]))
-        sleep(0.02)   # Allow LCD time to powerup
+        self.device = i2c.device(i2c_addr, priority) if hasattr(i2c, "device") else None
+        self.buf = bytearray(4) # E high and low for both nibbles, sent in one transfer
+        self.backlight = True
+        self.ready_us = time.ticks_us() # no write before this time
+        self.lost = False               # a write was not acknowledged
+        self.errors = 0
+        self.display_ctrl = self.LCD_ON_CTRL | self.LCD_ON_DISPLAY
+        self.hal_init(num_lines)
+        LcdApi.__init__(self, num_lines, num_columns)
+
+    def hal_init(self, num_lines):
+        """Queues the initialisation by instruction, 4 bit mode and the number of lines."""
+        self.hal_write(bytearray([0]))
+        # Allow LCD time to powerup, counted from the start of the Pico
+        powerup_ms = POWERUP_MS - time.ticks_ms()
+        if powerup_ms > 0:
+            self.hal_delay_us(powerup_ms * 1000)
         # Send reset 3 times
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
-        sleep(0.005)    # need to delay at least 4.1 msec
+        self.hal_delay_us(5000)    # need to delay at least 4.1 msec
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
-        sleep(0.001)
+        self.hal_delay_us(1000)
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
-        sleep(0.001)
+        self.hal_delay_us(1000)
         # Put LCD into 4 bit mode
         self.hal_write_init_nibble(self.LCD_FUNCTION)
-        sleep(0.001)
-        LcdApi.__init__(self, num_lines, num_columns)
+        self.hal_delay_us(1000)
         cmd = self.LCD_FUNCTION
         if num_lines > 1:
             cmd |= self.LCD_FUNCTION_2LINES
@@ -299,52 +411,130 @@ class I2cLcd(LcdApi):
         This particular function is only used during initialization.
         """
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
+        self.hal_write(bytearray([byte | MASK_E, byte]))
+
+    def hal_write(self, data):
+        """Sends bytes to the PCF8574, directly or queued on the bus."""
+        if self.device:
+            self.device.write(data)
+            return
+        wait = time.ticks_diff(self.ready_us, time.ticks_us())
+        if wait > 0:
+            time.sleep_us(wait)
+        try:
+            self.i2c.writeto(self.i2c_addr, data)
+        except OSError: # no ACK
+            self.lost = True
+            self.errors += 1
+
+    def hal_delay_us(self, usecs):
+        """Delays the next write without blocking, on a bus also the other devices go on."""
+        if self.device:
+            self.device.delay_us(usecs)
+        else:
+            ready = time.ticks_add(time.ticks_us(), usecs)
+            if time.ticks_diff(ready, self.ready_us) > 0:
+                self.ready_us = ready
+
+    def flush(self):
+        """Waits until the queued writes are sent."""
+        if self.device:
+            self.device.flush()
+        else:
+            wait = time.ticks_diff(self.ready_us, time.ticks_us())
+            if wait > 0:
+                time.sleep_us(wait)
+
+    def check(self):
+        """Probes the display with the backlight byte. Reinitialises it and
+        restores the contents if it did not answer before or a write was
+        not acknowledged since the last check.
+
+        Returns True if the display answers.
+        """
+        self.flush()
+        if self.device:
+            self.lost = self.lost or self.device.errors != self.errors
+            self.errors = self.device.errors
+        i2c = self.device.bus.i2c if self.device else self.i2c
+        try:
+            i2c.writeto(self.i2c_addr, bytearray([self.backlight << SHIFT_BACKLIGHT]))
+        except OSError:
+            self.lost = True
+            return False
+        if self.lost:
+            self.lost = False
+            self.recover()
+        return True
+
+    def recover(self):
+        """Reinitialises the display and writes back the custom characters,
+        the contents of the shadow buffer, the cursor and the backlight.
+        """
+        self.hal_init(self.num_lines)
+        self.hal_write_command(self.LCD_ENTRY_MODE | self.LCD_ENTRY_INC)
+        for location in range(8):
+            if self.custom_chars[location]:
+                self.custom_char(location, self.custom_chars[location])
+        shadow = self.shadow
+        for y in range(self.num_lines):
+            LcdApi.move_to(self, 0, y)
+            for x in range(self.num_columns):
+                self.hal_write_data(shadow[y * self.num_columns + x])
+        self.move_to(self.cursor_x, self.cursor_y)
+        self.hal_write_command(self.display_ctrl)
+        if self.backlight:
+            self.hal_backlight_on()
+        else:
+            self.hal_backlight_off()
 
     def hal_backlight_on(self):
         """Allows the hal layer to turn the backlight on."""
-        self.i2c.writeto(self.i2c_addr, bytearray([1 << SHIFT_BACKLIGHT]))
+        self.hal_write(bytearray([1 << SHIFT_BACKLIGHT]))
 
     def hal_backlight_off(self):
         """Allows the hal layer to turn the backlight off."""
-        self.i2c.writeto(self.i2c_addr, bytearray([0]))
+        self.hal_write(bytearray([0]))
 
     def hal_write_command(self, cmd):
         """Writes a command to the LCD.
 
         Data is latched on the falling edge of E.
         """
-        byte = ((self.backlight << SHIFT_BACKLIGHT) | (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) | ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
+        if cmd & 0xf8 == self.LCD_ON_CTRL:
+            self.display_ctrl = cmd # restored by recover()
+        self.hal_write_byte(cmd, 0)
         if cmd <= 3:
             # The home and clear commands require a worst case delay of 4.1 msec
-            sleep(0.005)
+            self.hal_delay_us(5000)
 
     def hal_write_data(self, data):
         """Write data to the LCD."""
-        byte = (MASK_RS | (self.backlight << SHIFT_BACKLIGHT) | (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
-        byte = (MASK_RS | (self.backlight << SHIFT_BACKLIGHT) | ((data & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
+        self.hal_write_byte(data, MASK_RS)
+
+    def hal_write_byte(self, value, rs):
+        """Writes both nibbles of a byte with a single I2C transfer, the
+        PCF8574 outputs every received byte in turn.
+        """
+        buf = self.buf
+        byte = (rs | (self.backlight << SHIFT_BACKLIGHT) | (((value >> 4) & 0x0f) << SHIFT_DATA))
+        buf[0] = byte | MASK_E
+        buf[1] = byte
+        byte = (rs | (self.backlight << SHIFT_BACKLIGHT) | ((value & 0x0f) << SHIFT_DATA))
+        buf[2] = byte | MASK_E
+        buf[3] = byte
+        self.hal_write(buf)
 
     def hal_sleep_us(self, usecs):
         """Sleep for some time (given in microseconds)."""
-        sleep(float(usecs)/1e6)
+        self.hal_delay_us(usecs)
 
 #
 # Test program 
 #
-from machine import Pin, I2C
-import gc
-
 if __name__ == "__main__":
+    from machine import Pin, I2C
+    import gc
     
     print("I2C - LCD test start")
     # open I2C port
@@ -1,10 +1,34 @@
-from lcd_pico import I2cLcd
+from lcd_pico import I2cLcd, format_number
+from I2cBus import I2cBus
+from Tracer import Tracer, EV_ENCODER_CLICK, EV_LCD_BEGIN, EV_LCD_END, EV_DISPLAY_UPDATE
+from Metrics import metrics
+from IrqEncoder import IrqEncoder
+from Stepper import Stepper
+from MotionCore import MotionCore
+from Jog import JogFollower
+from Supervisor import Supervisor
+from Recorder import Recorder, CH_ENCODER, CH_SWITCH
 from machine import Pin, I2C
-from _thread import start_new_thread, allocate_lock
+import micropython
 import utime
 
-lock = allocate_lock()
+# one tracer per source, dump them from the REPL with tracer_display.dump("trace0.bin") and decode them with trace_decode.py
+tracer_display = Tracer(512, source = 0)
+tracer_encoder = Tracer(512, source = 1)
 
+# print the state of the controller in the REPL with metrics.report()
+m_encoder_clicks = metrics.counter("encoder_clicks")
+m_display_updates = metrics.counter("display_updates")
+m_lcd_write_us = metrics.histogram("lcd_write_us")
+m_gc_pause_us = metrics.histogram("gc_pause_us")
+
+# watchdog, fed only while the motion loop, the encoder callbacks and the display loop make progress, read supervisor.status() in the REPL
+supervisor = Supervisor(timeout_ms = 2000, metrics = metrics)
+task_display = supervisor.task("display", 1000)
+task_encoder = supervisor.task("encoder", 1000)
+
+# inputs and commands for replay.py, dump them from the REPL with recorder.dump("inputs.bin")
+recorder = Recorder(4096)
 
 # init LEDs
 led_green = Pin(13, Pin.OUT)
@@ -13,9 +37,11 @@ led_red = Pin(15, Pin.OUT)
 
 # init display
 display_i2c = I2C(0, scl=Pin(1), sda=Pin(0), freq=400000)
-LCD = I2cLcd(display_i2c, 39, 2, 16) # Address = 39, number of lines = 2, number of symbols per line = 16
+display_bus = I2cBus(display_i2c) # shared with further displays and sensors, register them with display_bus.device()
+LCD = I2cLcd(display_bus, 39, 2, 16) # Address = 39, number of lines = 2, number of symbols per line = 16
+# the initialisation of the LCD is queued on the bus and runs out during the following start-up
 
-# init hand encoder
+# init hand encoder, counted by pin interrupts, so core 1 is free for the motion
 encoder_clk = Pin(16, Pin.IN) # clock of hand encoder
 encoder_dt = Pin(17, Pin.IN) # dt of hand encoder
 encoder_sw = Pin(18, Pin.IN, Pin.PULL_UP) # switch of hand encoder
@@ -24,85 +50,66 @@ encoder_stepSpeed = [[200, 1], [175, 2], [150, 3], [137, 4], [125, 5], [120, 6],
              [100, 10], [95, 12], [90, 14], [85, 16], [80, 18], [75, 20], [50, 50], [25, 100], [20, 175],
              [15, 275], [10, 550]]
 
-global encoder_counter
-global encoder_acceleration
+# init stepper, jogged with the hand encoder on core 1, the switch of the encoder stops it (Stepper.STOP_PIN)
+JOG_STEPS_PER_COUNT = 10
+# the step counts and overruns appear in metrics.report(), tracer = Tracer(...) would also record every step but disables the viper loops
+stepper = Stepper(Pin(2), Pin(3), Pin(4), 600, 50, 1200, 400, 800, metrics = metrics)
+motion = MotionCore(stepper, jog = JogFollower(stepper), supervisor = supervisor, recorder = recorder) # halted and asleep before a watchdog reset
 
-def hand_encoder_thread(clk, dt, stepSpeed):
-    global encoder_counter
-    global encoder_acceleration
-    
-    clk_lastState = [utime.ticks_ms(), utime.ticks_ms(), clk.value()] #2x time ticks required to avoid big count steps when a single click has a low delte time
-    encoder_watchdog = 0
+def encoder_click(counter): # scheduled after the interrupt
+    motion.jog_to(counter * JOG_STEPS_PER_COUNT) # only the last target counts, bursts coalesce
+    tracer_encoder.event(EV_ENCODER_CLICK, counter)
+    m_encoder_clicks.inc()
+    led_green.toggle()
 
-    while True:
-        try:
-            if encoder_watchdog >= 2500:
-                led_green.toggle()
-                encoder_watchdog = 0
-            clk_value = clk.value()
-            dt_value = dt.value()
-                
-            if clk_value != clk_lastState[2]:
-                if clk_value == 1:
-                    countStep = 1
-                    currentTimeTicks = utime.ticks_ms()
-                    if encoder_acceleration:
-                        lastTimeTicks = clk_lastState[1]
-                        if clk_lastState[0] > lastTimeTicks: lastTimeTicks = clk_lastState[0]
-                        deltaTime = currentTimeTicks - lastTimeTicks
-                        for speed in stepSpeed:
-                            if deltaTime < speed[0]: countStep = speed[1]
-                    if dt_value == 0:
-                        lock.acquire()
-                        encoder_counter += countStep
-                        lock.release()
-                    else:
-                        lock.acquire()
-                        encoder_counter -= countStep
-                        lock.release()
-                    clk_lastState[0] = clk_lastState[1]
-                    clk_lastState[1] = currentTimeTicks
-                
-                clk_lastState[2] = clk_value
-            utime.sleep_us(100)
-            encoder_watchdog += 1
-        except:
-            print("Somthing went wrong, reading the encoder")
+encoder = IrqEncoder(encoder_clk, encoder_dt, encoder_stepSpeed, acceleration = True, on_click = encoder_click, recorder = recorder)
+recorder.watch(encoder_sw, CH_SWITCH) # also the stop pin of the stepper
+recorder.start([(CH_ENCODER, encoder.pins())])
 
-# start hand_encoder_thread
-encoder_counter = 0
-encoder_acceleration = True
-start_new_thread(hand_encoder_thread, (encoder_clk, encoder_dt, encoder_stepSpeed))
+motion.start()
+motion.power(True)
+motion.jog(True)
+
+def encoder_alive(arg): # scheduled like encoder_click, so it only runs while the scheduled callbacks are served
+    supervisor.report(task_encoder)
 
 # display
 LCD.backlight_on()
-lock.acquire()
-counter = encoder_counter
-lock.release()
+counter = encoder.value()
 counter_old = counter
+row = bytearray(16) # first line of the display, rendered without allocating strings
 LCD.clear()
-LCD.putstr(str(counter))
+format_number(row, counter, right = False)
+LCD.update_row(0, row)
+LCD.flush()
 print(counter)
+display_cycles = 0
 
 while True:
-    #try:
-    led_red.toggle()
-    lock.acquire()
-    counter = encoder_counter
-    lock.release()
-    if counter != counter_old:
-        text = str(counter)
-        number_of_char = len(text)
-        if number_of_char < 16:
-            for i in range(16-number_of_char):
-                text += " "
-        #LCD.hal_write_command(0x02) #set cursor of display to home position
-        #LCD.cursor_x = 0
-        #LCD.cursor_y = 0
-        LCD.move_to(0,0)
-        LCD.putstr(text)
-        print(counter)
-        counter_old = counter
+    try:
+        led_red.toggle()
+        display_cycles += 1
+        if display_cycles % 16 == 0: # about every 4 s
+            LCD.check() # reinitialises and restores the display after it was lost
+        counter = encoder.value()
+        if counter != counter_old:
+            format_number(row, counter, right = False) # left aligned like before, padded with spaces
+            tracer_display.event(EV_LCD_BEGIN)
+            lcd_ticks = utime.ticks_us()
+            LCD.update_row(0, row) # only the changed digits are sent
+            LCD.flush()
+            m_lcd_write_us.observe(utime.ticks_diff(utime.ticks_us(), lcd_ticks))
+            tracer_display.event(EV_LCD_END)
+            tracer_display.event(EV_DISPLAY_UPDATE, counter)
+            m_display_updates.inc()
+            counter_old = counter
+        metrics.collect_gc(m_gc_pause_us) # short regular pauses instead of long ones in the middle of an update
+        supervisor.report(task_display)
+        try:
+            micropython.schedule(encoder_alive, 0)
+        except RuntimeError: # queue full, the encoder task misses its deadline
+            pass
+    except Exception as e:
+        supervisor.fault(task_display, e) # motor stopped, no more feeding: the watchdog resets
+    supervisor.check()
     utime.sleep_ms(250)
-    #except:
-        #print("Something went wrong, controlling the display")
@@ -0,0 +1,36 @@
+# Freezes the controller modules into the firmware: they are compiled to .mpy
+# at build time and imported from flash without parsing and with less RAM.
+#
+#   cd micropython/ports/rp2
+#   make BOARD=RPI_PICO FROZEN_MANIFEST=/path/to/this/manifest.py
+#
+# Check the result with boot_profile.py ("from" shows frozen). The host tools
+# (trace_decode.py, ramp_analysis.py, replay.py) and the application (main1.py) stay out.
+include("$(PORT_DIR)/boards/manifest.py")
+
+module("Compat.py")
+module("FastLoops.py")
+module("FixedPoint.py")
+module("Tracer.py")
+module("Metrics.py")
+module("PIOManager.py")
+module("SMFrequency.py")
+module("SMCounter.py")
+module("SMSteps.py")
+module("SMCapture.py")
+module("StepperBackends.py")
+module("Stepper.py")
+module("ProfileCompiler.py")
+module("RampCache.py")
+module("TorqueRamp.py")
+module("SCurve.py")
+module("PowerPolicy.py")
+module("StallDetector.py")
+module("MotionCore.py")
+module("Jog.py")
+module("Recorder.py")
+module("IrqEncoder.py")
+module("Supervisor.py")
+module("I2cBus.py")
+module("lcd_pico.py")
+module("boot_profile.py")
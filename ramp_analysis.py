@@ -0,0 +1,166 @@
+"""
+Host tool for analysing ramp tables with NumPy (not available on the Pico).
+
+Usage: python ramp_analysis.py [steps] [accel_max]
+
+Computes velocity, acceleration and jerk of the ramps of FixedPoint.calc_ramp (or of
+intervals captured with SMCapture), their deviation from the ideal linear ramp, the
+time spent in resonance bands and the floor to floor time of Stepper.do_steps for
+whole parameter sweeps at once. Ramps of different length are padded with NaN into
+one 2D array, so every metric is computed for all ramps in a single operation.
+"""
+import sys
+
+import numpy as np
+
+from FixedPoint import calc_ramp, rpm_to_freq_q, to_q, freq_to_period_us, CORRECTION_SHIFT
+
+# period times of the table per step: the backends emit one step per period time
+# (SMFrequency runs about 50 cycles at 100 MHz per unit of y in each phase, so high
+# and low together last the period time)
+STEP_SCALE = 1
+RAMP_SCALE = 2 # period times per step assumed by FixedPoint.calc_ramp (the float ramp advances by 2 * y)
+CAPTURE_FREQ = 125_000_000 # SMCapture.CAPTURE_FREQ, cycles per second of the intervals
+
+
+def pad(ramps):
+    """
+    Returns:
+    A 2D float array with one ramp (list of period times in us) per row, padded with NaN
+    """
+    width = max([len(r) for r in ramps] + [1])
+    table = np.full((len(ramps), width), np.nan)
+    for i, ramp in enumerate(ramps):
+        table[i, :len(ramp)] = ramp
+    return table
+
+def from_capture(intervals, freq = CAPTURE_FREQ):
+    """Converts the intervals of SMCapture.capture (in cycles) into step times in us, use scale = 1 with them."""
+    return np.asarray(intervals, dtype = float) * 1e6 / freq
+
+def kinematics(periods, scale = STEP_SCALE, window = 1):
+    """
+    periods: 1D or 2D array of period times in us (rows padded with NaN)
+    window: int, steps between the velocities of a difference, larger values hide the
+            rounding of the period times to whole us
+
+    Returns:
+    (t, v, a, j): start time of every step (s), velocity (steps/s) during the step,
+    acceleration (steps/s**2) and jerk (steps/s**3) over window steps
+    """
+    dt = np.asarray(periods, dtype = float) * scale * 1e-6
+    t = np.cumsum(np.nan_to_num(dt), axis = -1) - np.nan_to_num(dt)
+    t[np.isnan(dt)] = np.nan
+    v = 1 / dt
+    mid = t + dt / 2
+    a = (v[..., window:] - v[..., :-window]) / (mid[..., window:] - mid[..., :-window])
+    mid_a = (mid[..., window:] + mid[..., :-window]) / 2
+    j = (a[..., window:] - a[..., :-window]) / (mid_a[..., window:] - mid_a[..., :-window])
+    return t, v, a, j
+
+def duration(periods, scale = STEP_SCALE):
+    """Returns the time (s) of the ramps, per row."""
+    return np.nansum(np.asarray(periods, dtype = float), axis = -1) * scale * 1e-6
+
+def ideal_error(periods, freq_start, freq_end, ramp_time, scale = STEP_SCALE):
+    """
+    Compares the ramps with the linear velocity ramp from freq_start to freq_end (Hz)
+    within ramp_time (ms, scalar or one per row). A table of calc_ramp lasts
+    ramp_time * scale / RAMP_SCALE, so the ideal ramp is scaled the same way.
+
+    Returns:
+    (maximum velocity error in steps/s, duration error in s), per row
+    """
+    t, v, a, j = kinematics(periods, scale)
+    ramp_time = np.asarray(ramp_time, dtype = float)[..., np.newaxis] * 1e-3 * scale / RAMP_SCALE
+    dt = np.asarray(periods, dtype = float) * scale * 1e-6
+    progress = np.clip((t + dt / 2) / ramp_time, 0, 1)
+    ideal = freq_start + (freq_end - freq_start) * progress
+    error = np.nanmax(np.abs(v - ideal), axis = -1)
+    return error, duration(periods, scale) - ramp_time[..., 0]
+
+def dwell(periods, bands, scale = STEP_SCALE):
+    """
+    bands: list of (low, high) velocities in steps/s, e.g. the resonances of the motor
+
+    Returns:
+    The time (s) spent inside the bands, per row
+    """
+    dt = np.asarray(periods, dtype = float) * scale * 1e-6
+    v = 1 / dt
+    inside = np.zeros(dt.shape, dtype = bool)
+    for low, high in bands:
+        inside |= (v >= low) & (v < high)
+    return np.nansum(np.where(inside, dt, 0), axis = -1)
+
+def move_time(steps, up, dn, period_hi, period_lo, min_const_steps = 10, scale = STEP_SCALE):
+    """
+    Time (s) of Stepper.do_steps(steps) for every combination of the ramps up (rows) and dn (columns).
+
+    Returns:
+    A 2D array [up, dn]
+    """
+    n_up = np.sum(~np.isnan(up), axis = -1)[:, np.newaxis]
+    n_dn = np.sum(~np.isnan(dn), axis = -1)[np.newaxis, :]
+    const = steps - n_up - n_dn
+    ramped = duration(up, scale)[:, np.newaxis] + duration(dn, scale)[np.newaxis, :] + const * period_hi * scale * 1e-6
+    return np.where(const > min_const_steps, ramped, steps * period_lo * scale * 1e-6)
+
+def sweep(steps, steps_per_rev, rpm_lo, rpm_hi, ramp_up_times, ramp_dn_times, corrections = (1.0,),
+          accel_max = None, bands = (), scale = STEP_SCALE, window = 8):
+    """
+    Evaluates all combinations of ramp_up_time, ramp_dn_time (ms) and ramp correction factor
+    for a move of steps steps.
+
+    accel_max: float (steps/s**2), acceleration the motor torque allows, None for no limit
+
+    Returns:
+    A list of dicts sorted by the move time, moves exceeding accel_max are marked with ok = False
+    """
+    f_lo_q = rpm_to_freq_q(rpm_lo, steps_per_rev)
+    f_hi_q = rpm_to_freq_q(rpm_hi, steps_per_rev)
+    period_hi = freq_to_period_us(f_hi_q)
+    period_lo = freq_to_period_us(f_lo_q)
+    f_lo = steps_per_rev * rpm_lo / 60 / scale
+    f_hi = steps_per_rev * rpm_hi / 60 / scale
+    results = []
+    for correction in corrections:
+        k_q = to_q(correction, CORRECTION_SHIFT)
+        up = pad([calc_ramp(f_lo_q, f_hi_q, t, k_q) for t in ramp_up_times])
+        dn = pad([calc_ramp(f_hi_q, f_lo_q, t, k_q) for t in ramp_dn_times])
+        times = move_time(steps, up, dn, period_hi, period_lo, scale = scale)
+        t, v, a, j = kinematics(up, scale, window)
+        a_up = np.nanmax(np.abs(a), axis = -1)
+        j_up = np.nanmax(np.abs(j), axis = -1)
+        t, v, a, j = kinematics(dn, scale, window)
+        a_dn = np.nanmax(np.abs(a), axis = -1)
+        j_dn = np.nanmax(np.abs(j), axis = -1)
+        e_up = ideal_error(up, f_lo, f_hi, ramp_up_times, scale)[0]
+        e_dn = ideal_error(dn, f_hi, f_lo, ramp_dn_times, scale)[0]
+        d_up = dwell(up, bands, scale)
+        d_dn = dwell(dn, bands, scale)
+        for i, t_up in enumerate(ramp_up_times):
+            for k, t_dn in enumerate(ramp_dn_times):
+                accel = max(a_up[i], a_dn[k])
+                results.append({"ramp_up_time": t_up, "ramp_dn_time": t_dn, "correction": correction,
+                                "move_time": times[i, k], "accel": accel, "jerk": max(j_up[i], j_dn[k]),
+                                "error": max(e_up[i], e_dn[k]), "dwell": d_up[i] + d_dn[k],
+                                "ok": accel_max is None or accel <= accel_max})
+    results.sort(key = lambda r: r["move_time"])
+    return results
+
+def print_sweep(results, limit = 20, out = sys.stdout):
+    print("%6s %6s %5s %9s %12s %14s %10s %8s %s" % ("up ms", "dn ms", "corr", "move s", "accel st/s2", "jerk st/s3",
+                                                  "error st/s", "dwell s", "ok"), file = out)
+    for r in results[:limit]:
+        print("%6d %6d %5.2f %9.3f %12.0f %14.0f %10.1f %8.3f %s" % (r["ramp_up_time"], r["ramp_dn_time"], r["correction"],
+              r["move_time"], r["accel"], r["jerk"], r["error"], r["dwell"], "" if r["ok"] else "too fast"), file = out)
+
+
+if __name__ == "__main__":
+    # floor to floor move of the elevator: 800 steps per revolution, 50 -> 600 rpm
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    accel_max = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    results = sweep(steps, 800, 50, 600, range(200, 2001, 200), range(200, 1001, 100), (1.0, 1.06, 1.2),
+                    accel_max = accel_max, bands = [(300, 400)])
+    print_sweep([r for r in results if r["ok"]])
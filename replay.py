@@ -0,0 +1,279 @@
+"""
+Host tool for replaying the recordings of Recorder at exact virtual times.
+
+Usage: python replay.py recording.bin [--profile floor.bin ...] [--save result.json] [--compare result.json]
+       python replay.py --demo [--save result.json] [--compare result.json]
+
+The encoder/display loop of main1.py and the jogged Stepper (SimulatedBackend)
+run on a virtual clock: every recorded pin transition reaches IrqEncoder at its
+recorded time, the display loop runs every DISPLAY_MS plus the time of its LCD
+writes, the jog follower runs its chunks with the virtual duration of their
+steps and the recorded commands are executed when the motion is free. Moves are
+not interrupted, the stop pin is sampled at the start of every move and chunk.
+The compiled profiles are not recorded: give the files of the profiles registered
+with MotionCore.register_profile in the same order with --profile, a CMD_PROFILE
+without its file stops the replay with an error. CMD_QUIT ends the motion like
+on target, later commands are not executed.
+
+The result holds the counts (clicks, display updates, sent characters, steps,
+position) and the latencies from a click to the display and to the end of the
+motion. --compare fails if a count differs or a latency got worse, so every
+recording from the field is a repeatable regression test.
+"""
+import json
+import sys
+import time
+
+from IrqEncoder import IrqEncoder, STEP_SPEED, LAST_TICKS
+from Jog import JogFollower
+from MotionCore import CMD_MOVE, CMD_PROFILE, CMD_POWER, CMD_QUIT, CMD_JOG, CMD_JOG_TO
+from Recorder import REC_PIN, REC_CMD, CH_ENCODER, CH_SWITCH, CH_STOP, read_recording
+from Stepper import Stepper
+from StepperBackends import SimulatedBackend, SimPin
+from lcd_pico import LcdApi, format_number
+
+DISPLAY_MS = 250          # sleep of the display loop of main1.py
+JOG_STEPS_PER_COUNT = 10  # like main1.py
+LCD_BYTE_US = 450         # one character or command over the I2C expander: 4 writes of 2 bytes at 400 kHz plus the overhead
+LCD_CLEAR_US = 5000
+COUNTS = ["clicks", "count", "display_updates", "lcd_bytes", "steps", "position", "target", "target_recorded", "commands"]
+LATENCIES = ["display_latency_max_us", "motion_latency_max_us"]
+
+
+class SimLcd(LcdApi):
+    """LCD without hardware, adds up the virtual time of the writes."""
+
+    def __init__(self, num_lines = 2, num_columns = 16):
+        self.time_us = 0
+        self.bytes = 0
+        LcdApi.__init__(self, num_lines, num_columns)
+
+    def hal_write_command(self, cmd):
+        self.bytes += 1
+        self.time_us += LCD_CLEAR_US if cmd <= 3 else LCD_BYTE_US
+
+    def hal_write_data(self, data):
+        self.bytes += 1
+        self.time_us += LCD_BYTE_US
+
+    def hal_sleep_us(self, usecs):
+        self.time_us += usecs
+
+
+class Replay:
+    """Virtual main1.py: encoder, display loop and jogged stepper."""
+
+    def __init__(self, records, profiles = ()):
+        """
+        records: list of read_recording
+        profiles: list of paths of compiled profiles (ProfileCompiler), in the order of MotionCore.register_profile
+        """
+        self.records = records
+        self.profiles = profiles
+        self.quit = False   # CMD_QUIT was executed
+        self.lcd = SimLcd()
+        self.row = bytearray(16)
+        self.backend = SimulatedBackend()
+        self.stop = SimPin()
+        self.stepper = Stepper(SimPin(), SimPin(), SimPin(), 600, 50, 1200, 400, 800, self.backend, stop_pin = self.stop)
+        self.jog = JogFollower(self.stepper)
+        self.jogging = True # main1.py starts with motion.jog(True)
+        self.commands = []  # recorded commands waiting for the motion
+        self.now_us = 0
+        self.motion_us = 0  # the motion is busy until this time
+        self.click_us = None  # first click which is not displayed yet
+        self.target_us = None # first jog target which is not reached yet
+        self.result = dict.fromkeys(COUNTS + LATENCIES, 0)
+        self.result["target_recorded"] = None # no jog target in the recording
+        self.encoder = IrqEncoder(SimPin(), SimPin(), STEP_SPEED, acceleration = True, on_click = self.encoder_click)
+        self.encoder.state[LAST_TICKS] = 0 # virtual time instead of the clock of the host
+        self.counter_old = self.encoder.value()
+
+    def encoder_click(self, counter): # like main1.py, runs at once on the host
+        self.jog.set_target(counter * JOG_STEPS_PER_COUNT)
+        if self.click_us is None:
+            self.click_us = self.now_us
+        if self.target_us is None:
+            self.target_us = self.now_us
+
+    def apply(self, kind, channel, value):
+        result = self.result
+        if kind == REC_PIN:
+            if channel == CH_ENCODER:
+                clicks = self.encoder.clicks()
+                self.encoder.transition(value, self.now_us // 1000)
+                result["clicks"] += self.encoder.clicks() - clicks
+            elif channel == CH_SWITCH or channel == CH_STOP: # the switch of the encoder is the stop pin in main1.py
+                self.stop.value(value)
+        elif kind == REC_CMD:
+            if channel == CMD_JOG_TO:
+                result["target_recorded"] = value # last jog target of the Pico, compared like the counts ("target" is the one of the replay)
+            else:
+                self.commands.append((channel, value))
+                result["commands"] += 1
+
+    def display(self):
+        """One cycle of the display loop, returns its duration."""
+        counter = self.encoder.value()
+        if counter == self.counter_old:
+            return 0
+        lcd = self.lcd
+        start = lcd.time_us
+        format_number(self.row, counter, right = False)
+        lcd.update_row(0, self.row)
+        duration = lcd.time_us - start
+        self.result["display_updates"] += 1
+        if self.click_us is not None:
+            latency = self.now_us + duration - self.click_us
+            self.result["display_latency_max_us"] = max(self.result["display_latency_max_us"], latency)
+            self.click_us = None
+        self.counter_old = counter
+        return duration
+
+    def motion(self):
+        """Runs the next command or jog chunk, returns False if the motion is idle."""
+        stepper = self.stepper
+        jog = self.jog
+        start = self.backend.time_us
+        if self.quit:
+            return False
+        if self.commands:
+            if jog.moving():
+                jog.brake()
+            cmd, arg = self.commands.pop(0)
+            if cmd == CMD_MOVE:
+                stepper.do_steps(arg)
+            elif cmd == CMD_PROFILE:
+                if arg >= len(self.profiles):
+                    raise ValueError("profile %d was run, give its file with --profile" % arg)
+                stepper.run_profile(self.profiles[arg])
+            elif cmd == CMD_JOG:
+                self.jogging = arg == 1
+                jog.set_target(stepper.position)
+            elif cmd == CMD_POWER:
+                stepper.power_on() if arg else stepper.power_off()
+            elif cmd == CMD_QUIT:
+                self.quit = True
+                self.jogging = False
+            else:
+                raise ValueError("unknown command %d" % cmd)
+        elif self.jogging and not jog.done():
+            jog.update()
+            if jog.done() and self.target_us is not None:
+                latency = self.now_us + self.backend.time_us - start - self.target_us
+                self.result["motion_latency_max_us"] = max(self.result["motion_latency_max_us"], latency)
+                self.target_us = None
+        else:
+            return False
+        self.motion_us = self.now_us + self.backend.time_us - start
+        return True
+
+    def run(self):
+        """
+        Replays the records and runs on until the display and the motion are idle.
+
+        Returns:
+        A dict of the counts and latencies
+        """
+        records = self.records
+        i = 0
+        display_us = 0
+        end_us = records[-1][0] if records else 0
+        while True:
+            motion_free = self.motion_us
+            next_record = records[i][0] if i < len(records) else None
+            # earliest of: next record, next display cycle, motion
+            candidates = [display_us, motion_free]
+            if next_record is not None:
+                candidates.append(next_record)
+            self.now_us = min(candidates)
+            if next_record is not None and self.now_us == next_record:
+                self.apply(*records[i][1:])
+                i += 1
+            elif self.now_us == display_us:
+                display_us += self.display() + DISPLAY_MS * 1000
+            elif not self.motion():
+                if next_record is None and self.now_us > end_us and self.encoder.value() == self.counter_old:
+                    break
+                self.motion_us = min(display_us, next_record if next_record is not None else display_us)
+        result = self.result
+        result["count"] = self.encoder.value()
+        result["lcd_bytes"] = self.lcd.bytes
+        result["steps"] = self.backend.steps
+        result["position"] = self.stepper.position
+        result["target"] = self.jog.target[0]
+        result["virtual_ms"] = self.now_us // 1000
+        return result
+
+
+def demo_records():
+    """A synthetic recording: slow clicks, a fast burst, a short press of the switch and a move."""
+    records = [(0, REC_PIN, CH_SWITCH, 1), (0, REC_PIN, CH_ENCODER, 0)]
+    t = 0
+    def click(t, direction, ms):
+        states = [2, 3, 1, 0] if direction > 0 else [1, 3, 2, 0]
+        for state in states:
+            t += ms * 1000 // 4
+            records.append((t, REC_PIN, CH_ENCODER, state))
+        return t
+    for i in range(5):
+        t = click(t, 1, 300)
+    for i in range(30):
+        t = click(t, 1, 30)
+    t += 200_000
+    records.append((t, REC_PIN, CH_SWITCH, 0))
+    t += 50_000
+    records.append((t, REC_PIN, CH_SWITCH, 1))
+    for i in range(10):
+        t = click(t, -1, 120)
+    t += 1_000_000
+    records.append((t, REC_CMD, CMD_MOVE, 4000))
+    return records
+
+def compare(result, expected):
+    """
+    Returns:
+    A list of the differences to an earlier result, empty if the replay is as good
+    """
+    differences = []
+    for key in COUNTS:
+        if result[key] != expected.get(key):
+            differences.append("%s: %s, expected %s" % (key, result[key], expected.get(key)))
+    for key in LATENCIES:
+        if result[key] > expected.get(key, 0):
+            differences.append("%s: %d us, expected at most %d us" % (key, result[key], expected.get(key, 0)))
+    return differences
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    paths = []
+    profiles = []
+    while args:
+        arg = args.pop(0)
+        if arg in ("--save", "--compare"):
+            options[arg] = args.pop(0)
+        elif arg == "--profile":
+            profiles.append(args.pop(0))
+        else:
+            paths.append(arg)
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+    records = demo_records() if paths[0] == "--demo" else read_recording(paths[0])
+    start = time.perf_counter()
+    result = Replay(records, profiles).run()
+    host_ms = (time.perf_counter() - start) * 1000
+    for key, value in result.items():
+        print("%-24s %s" % (key, value))
+    print("%-24s %.1f (not compared)" % ("host_ms", host_ms))
+    if "--save" in options:
+        with open(options["--save"], "w") as f:
+            json.dump(result, f, indent = 1)
+    if "--compare" in options:
+        with open(options["--compare"]) as f:
+            differences = compare(result, json.load(f))
+        for line in differences:
+            print("REGRESSION " + line)
+        sys.exit(1 if differences else 0)
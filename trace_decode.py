@@ -0,0 +1,149 @@
+"""
+Host tool for decoding the dumps of Tracer.
+
+Usage: python trace_decode.py [--timeline] trace_core0.bin [trace_core1.bin ...]
+
+Prints the per section time budget (BEGIN/END pairs), histograms of the
+intervals between events of the same id and optionally the merged timeline.
+The timestamps of every dump are unwrapped backwards from the ticks_us() of the
+dump, so dumps taken within 2**29 us (9 minutes) of each other line up.
+"""
+import struct
+import sys
+
+from Compat import TICKS_PERIOD # ticks_us() of Micropython wraps at 2**30
+from Tracer import EVENT_NAMES, HEADER, MAGIC
+
+HISTOGRAM_BUCKETS = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000]
+
+
+def is_section(event):
+    return event < 16 and event in EVENT_NAMES
+
+def event_name(event):
+    name = EVENT_NAMES.get(event, "event_%d" % event)
+    if is_section(event):
+        name += " begin" if event % 2 else " end"
+    return name
+
+def read_trace(path):
+    """
+    Reads a dump.
+
+    Returns:
+    The ticks_us() of the dump and a list of (time in us, source, event, arg), the time
+    relative to the dump (<= 0), unwrapped from the newest record backwards
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, source, _, n, dumped = struct.unpack_from(HEADER, data)
+    if magic != MAGIC:
+        raise ValueError("%s is not a trace dump of this version" % path)
+    records = []
+    offset = struct.calcsize(HEADER)
+    t = 0
+    later = dumped
+    for i in range(n - 1, -1, -1):
+        ts, ev = struct.unpack_from("<II", data, offset + 8 * i)
+        t -= (later - ts) % TICKS_PERIOD
+        later = ts
+        records.append((t, source, ev >> 24, ev & 0xffffff))
+    records.reverse()
+    return dumped, records
+
+def merge(traces):
+    """
+    Merges the records of several dumps (the cores share the same timer) on the time scale of
+    the first dump: its ticks_us() is the common reference of the dumps.
+    """
+    reference = traces[0][0]
+    half = TICKS_PERIOD >> 1
+    records = []
+    for dumped, trace in traces:
+        shift = (dumped - reference + half) % TICKS_PERIOD - half # signed like ticks_diff
+        records.extend([(t + shift, source, event, arg) for t, source, event, arg in trace])
+    records.sort()
+    return records
+
+def budgets(records):
+    """
+    Returns:
+    A dict section name: [count, total us, max us] of BEGIN/END pairs
+    """
+    result = {}
+    open_sections = {}
+    for t, source, event, arg in records:
+        if not is_section(event):
+            continue
+        name = EVENT_NAMES[event]
+        key = (source, name)
+        if event % 2: # BEGIN
+            open_sections[key] = t
+        elif key in open_sections:
+            dt = t - open_sections.pop(key)
+            entry = result.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += dt
+            entry[2] = max(entry[2], dt)
+    return result
+
+def intervals(records):
+    """
+    Returns:
+    A dict event name: list of intervals in us between consecutive events of this id
+    """
+    last = {}
+    result = {}
+    for t, source, event, arg in records:
+        if is_section(event) and event % 2 == 0:
+            continue # the interval between two BEGIN events is the period of the section
+        key = (source, event)
+        if key in last:
+            result.setdefault(event_name(event), []).append(t - last[key])
+        last[key] = t
+    return result
+
+def histogram(values, buckets = HISTOGRAM_BUCKETS):
+    counts = [0] * (len(buckets) + 1)
+    for v in values:
+        for i, limit in enumerate(buckets):
+            if v < limit:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+def print_report(records, timeline = False, out = sys.stdout):
+    if not records:
+        print("no records", file = out)
+        return
+    t0 = records[0][0]
+    duration = records[-1][0] - t0
+    print("%d records within %.3f ms" % (len(records), duration / 1000), file = out)
+    if timeline:
+        print("\ntimeline", file = out)
+        for t, source, event, arg in records:
+            print("%12.3f ms  core %d  %-16s %d" % ((t - t0) / 1000, source, event_name(event), arg), file = out)
+    print("\ntime budget", file = out)
+    print("%-16s %8s %12s %10s %10s %7s" % ("section", "count", "total us", "mean us", "max us", "share"), file = out)
+    for name, (count, total, worst) in sorted(budgets(records).items(), key = lambda item: -item[1][1]):
+        share = 100.0 * total / duration if duration else 0
+        print("%-16s %8d %12d %10.1f %10d %6.1f%%" % (name, count, total, total / count, worst, share), file = out)
+    print("\nintervals", file = out)
+    labels = ["<%d" % b for b in HISTOGRAM_BUCKETS] + [">=%d" % HISTOGRAM_BUCKETS[-1]]
+    for name, values in sorted(intervals(records).items()):
+        print("%s: n=%d min=%d max=%d us" % (name, len(values), min(values), max(values)), file = out)
+        for label, count in zip(labels, histogram(values)):
+            if count:
+                print("  %8s us %8d %s" % (label, count, "#" * min(60, count * 60 // len(values) + 1)), file = out)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    show_timeline = "--timeline" in args
+    paths = [a for a in args if a != "--timeline"]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+    print_report(merge([read_trace(p) for p in paths]), show_timeline)